@@ -0,0 +1,72 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+log = logging.getLogger(__name__)
+
+
+class ArtifactStore:
+    # dumps of stored queries are immutable, as long as the result hash of the query does not change. They are written
+    # to disk once and served from there afterwards.
+
+    def __init__(self, directory, compress=True):
+        self.directory = directory
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def name(internal_id, result_hash, extension, options=None):
+        name = '{0}-{1}'.format(internal_id, result_hash)
+        if options:
+            name += '-' + hashlib.md5(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        return '{0}.{1}'.format(name, extension)
+
+    def lookup(self, name, gzipped=False):
+        path = os.path.join(self.directory, name)
+        if gzipped:
+            path += '.gz'
+        return path if os.path.isfile(path) else None
+
+    def materialize(self, name, chunks):
+        # passes the chunks through while writing them to a temporary file, which only becomes the artifact when all
+        # chunks have been written. An interrupted download therefore never leaves an incomplete artifact.
+        path = os.path.join(self.directory, name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        gz_path = None
+        completed = False
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                gz_raw, gz_file = None, None
+                if self.compress:
+                    gz_fd, gz_path = tempfile.mkstemp(dir=self.directory, suffix='.gz.tmp')
+                    gz_raw = os.fdopen(gz_fd, 'wb')
+                    gz_file = gzip.GzipFile(fileobj=gz_raw, mode='wb')
+
+                try:
+                    for chunk in chunks:
+                        if type(chunk) is str:
+                            chunk = chunk.encode('utf-8')
+                        f.write(chunk)
+                        if gz_file:
+                            gz_file.write(chunk)
+                        yield chunk
+                finally:
+                    if gz_file:
+                        gz_file.close()
+                        gz_raw.close()
+
+            # the compressed variant is moved first, so it exists whenever the uncompressed artifact exists
+            if gz_path:
+                os.replace(gz_path, path + '.gz')
+            os.replace(tmp_path, path)
+            completed = True
+            log.info('artifact %s written', name)
+        finally:
+            if not completed:
+                for leftover in [tmp_path, gz_path]:
+                    if leftover and os.path.exists(leftover):
+                        os.remove(leftover)
@@ -1,15 +1,23 @@
-import json
+import os
 
 import ckan.plugins.toolkit as toolkit
-import xmltodict
 from flask import Blueprint, request, Response, abort
+from werkzeug.wsgi import wrap_file
 
+from ckanext.mongodatastore import export, serializers
 from ckanext.mongodatastore.controller.mongodb import VersionedDataStoreController
 from ckanext.mongodatastore.exceptions import QueryNotFoundException
 
 bp = Blueprint('storedquery', __name__, url_prefix='/storedquery')
 
 
+@bp.teardown_app_request
+def remove_querystore_session(exception=None):
+    # every request thread works with its own querystore session, which is discarded when the request ends
+    if VersionedDataStoreController.instance is not None:
+        VersionedDataStoreController.instance.querystore.remove_session()
+
+
 @bp.route('/landingpage', methods=['GET'])
 def render_landing_page():
     internal_id = request.args.get('id')
@@ -32,83 +40,89 @@ def render_landing_page():
                                                                         'projection': result['fields']})
 
 
-CHUNK_SIZE = 10000
+def send_artifact(path, content_type, filename, etag, content_encoding=None):
+    # the file is passed to the WSGI server, which can send it without copying it through Python. Range requests and
+    # conditional requests are answered from the file as well.
+    size = os.path.getsize(path)
 
+    r = Response(wrap_file(request.environ, open(path, 'rb')), content_type=content_type, direct_passthrough=True)
+    r.content_length = size
+    r.set_etag(etag)
+    r.headers.set('Content-Disposition', 'attachment', filename=filename)
+    r.vary.add('Accept-Encoding')
+    if content_encoding:
+        r.content_encoding = content_encoding
 
-def generate_header(fields, delimiter):
-    header = ''
-    for field in fields:
-        header += field + delimiter
-    return header
+    return r.make_conditional(request, accept_ranges=True, complete_length=size)
 
 
 @bp.route('/<int:internal_id>/dump', methods=['GET'])
 def dump_query(internal_id):
     datastore_cntr = VersionedDataStoreController.get_instance()
 
-    def convert_csv_field(value):
-        if value:
-            return str(value).replace('\n', '')
-        return ''
-
-    def to_csv():
-        index = 0
-        result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-        records = list(result['records'])
-
-        fields = [field['id'] for field in result['fields']]
-        if csv_include_header:
-            yield generate_header(fields, csv_delimiter) + '\n'
-
-        while len(records) != 0:
-            for record in records:
-                yield csv_delimiter.join(map(lambda f: convert_csv_field(record[f]), fields)) + '\n'
-            index = index + CHUNK_SIZE
-            result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-            records = list(result['records'])
-
-    def to_json():
-        index = 0
-        result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-        records = list(result['records'])
-
-        yield '[\n'
-        while len(records) != 0:
-            for record in records:
-                yield json.dumps(record) + ', \n'
-            index = index + CHUNK_SIZE
-            result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-            records = list(result['records'])
-        yield ']'
-
-    def to_xml():
-        index = 0
-        result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-        records = list(result['records'])
-        yield '<records>'
-        while len(records) != 0:
-            for record in records:
-                yield xmltodict.unparse({'record': record}, full_document=False) + '\n'
-            index = index + CHUNK_SIZE
-            result = datastore_cntr.execute_stored_query(internal_id, index, CHUNK_SIZE, include_data=True)
-            records = list(result['records'])
-        yield '</records>'
-
     export_format = request.args.get('format', 'json')
     csv_delimiter = request.args.get('csvDelimiter', ';')
     csv_include_header = request.args.get('includeHeader', 'true').lower() == 'true'
 
+    try:
+        result = datastore_cntr.stream_stored_query(internal_id)
+    except QueryNotFoundException:
+        abort(404, 'Unfortunately there is no entry with pid {0} in the query store!'.format(internal_id))
+
+    options = None
     if export_format == 'csv':
-        r = Response(to_csv(), mimetype='text/csv', content_type='application/octet-datadump')
-        r.headers.set('Content-Disposition', 'attachment', filename='{0}.csv'.format(internal_id))
-        return r
+        if len(csv_delimiter) != 1:
+            abort(400, 'The CSV delimiter has to be a single character')
+
+        fields = [field['id'] for field in result['fields']]
+        chunks = serializers.serialize_csv(result['records'], fields, csv_delimiter, csv_include_header)
+        content_type = 'application/octet-datadump'
+        options = {'delimiter': csv_delimiter, 'header': csv_include_header}
     elif export_format == 'xml':
-        r = Response(to_xml(), mimetype='text/xml', content_type='application/octet-datadump')
-        r.headers.set('Content-Disposition', 'attachment', filename='{0}.xml'.format(internal_id))
-        return r
+        chunks, content_type = serializers.serialize_xml(result['records']), 'application/octet-datadump'
     elif export_format == 'json':
-        r = Response(to_json(), mimetype='text/json', content_type='application/octet-datadump')
-        r.headers.set('Content-Disposition', 'attachment', filename='{0}.json'.format(internal_id))
-        return r
-
-    abort(405, 'Export format "{0}" not supported'.format(export_format))
+        chunks, content_type = serializers.serialize_json(result['records']), 'application/octet-datadump'
+    elif export_format in export.COLUMNAR_FORMATS:
+        if export.pyarrow is None:
+            abort(501, 'Export format "{0}" requires the pyarrow package'.format(export_format))
+
+        content_type = export.COLUMNAR_FORMATS[export_format]
+        if export_format == 'parquet':
+            chunks = export.stream_parquet(result['records'], result['fields'])
+        else:
+            chunks = export.stream_arrow(result['records'], result['fields'])
+    else:
+        abort(405, 'Export format "{0}" not supported'.format(export_format))
+
+    filename = '{0}.{1}'.format(internal_id, export_format)
+    result_hash = result['query']['result_set_hash']
+    artifact_store = datastore_cntr.artifact_store
+
+    # as long as the result hash is not calculated, the result set is not verified yet and no artifact is written
+    if artifact_store and result_hash:
+        name = artifact_store.name(internal_id, result_hash, export_format, options)
+
+        if request.accept_encodings['gzip']:
+            path = artifact_store.lookup(name, gzipped=True)
+            if path:
+                return send_artifact(path, content_type, filename, '{0}-gzip'.format(result_hash), 'gzip')
+
+        path = artifact_store.lookup(name)
+        if path:
+            return send_artifact(path, content_type, filename, result_hash)
+
+        chunks = artifact_store.materialize(name, chunks)
+
+    # columnar formats are compressed by their writers already
+    content_encoding = None
+    if export_format not in export.COLUMNAR_FORMATS:
+        content_encoding = serializers.select_content_encoding(request.accept_encodings)
+        if content_encoding:
+            chunks = serializers.compress(chunks, content_encoding)
+
+    r = Response(chunks, content_type=content_type)
+    r.headers.set('Content-Disposition', 'attachment', filename=filename)
+    r.vary.add('Accept-Encoding')
+    if content_encoding:
+        r.content_encoding = content_encoding
+    return r
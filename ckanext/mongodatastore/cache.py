@@ -0,0 +1,165 @@
+import copy
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from bson import json_util
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class DiskCache:
+    def __init__(self, directory, maxsize):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{0}.pickle'.format(key))
+
+    def _scan(self):
+        # the entries are tracked in memory in the order of their last use, the directory is only listed to pick up the
+        # entries written by the other processes sharing it
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.name[:-len('.pickle')]))
+                except OSError:
+                    pass
+
+        self._entries = OrderedDict((key, None) for _, key in sorted(entries))
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self._entries.pop(key, None)
+            self.misses += 1
+            return default
+
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        # the entry is written to a temporary file first, so other processes never read a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            # the directory is listed once every maxsize puts, which keeps the cost of a put constant on average
+            self._puts += 1
+            if self._puts >= self.maxsize:
+                self._puts = 0
+                self._scan()
+
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            key, _ = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'directory': self.directory, 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class ResultCache:
+    def __init__(self, maxsize, directory=None, disk_maxsize=0):
+        self.memory = LRUCache(maxsize)
+        self.disk = DiskCache(directory, disk_maxsize) if directory and disk_maxsize > 0 else None
+
+    @property
+    def enabled(self):
+        return self.memory.maxsize > 0 or self.disk is not None
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.md5(json_util.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+
+        # cached results are copied, as callers add their own entries to the results they get
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        self.memory.put(key, copy.deepcopy(value))
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self):
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats() if self.disk else None}
@@ -1,14 +1,17 @@
+import json
 import logging
+import time
 
 import click as click
 from ckan.common import config as ckan_config
 from sqlalchemy import create_engine
 
+from ckanext.mongodatastore import migrations
 from ckanext.mongodatastore.controller.mongodb import VersionedDataStoreController
+from ckanext.mongodatastore.integrity import IntegrityReport, check_integrity
+from ckanext.mongodatastore.loader import FILE_FORMATS, LoadProgress, read_records
 from ckanext.mongodatastore.model import Base
 
-from datetime import datetime
-
 log = logging.getLogger(__name__)
 
 
@@ -29,31 +32,111 @@ def mongodatastore_init_querystore():
     engine = create_engine(querystore_url, echo=True)
 
     Base.metadata.create_all(engine)
+    # create_all does not add the new columns to the tables of an existing querystore, the migrations do
+    migrations.migrate(engine)
     log.debug('schema created!')
 
+
+@mongodatastore.command('mongodatastore_migrate_schema')
+@click.help_option(u'-h', u'--help')
+def mongodatastore_migrate_schema():
+    u'''Apply the pending migrations to the querystore schema.
+    '''
+    querystore_url = ckan_config[u'ckanext.mongodatastore.querystore_url']
+    engine = create_engine(querystore_url)
+
+    applied = migrations.migrate(engine)
+    for version, description in applied:
+        print('migration {0} applied: {1}'.format(version, description))
+
+    print('querystore schema is at version {0}'.format(migrations.LATEST_VERSION))
+
+
 @mongodatastore.command('mongodatastore_check_integrity')
 @click.help_option(u'-h', u'--help')
-@click.pass_context
-def mongodatastore_check_integrity(config=None):
-    print(config)
+@click.option('--workers', type=int, default=4, help='Number of worker processes checking queries in parallel.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='File the results are appended to. A check started with the same file skips the queries that '
+                   'have already been checked.')
+@click.option('--sample', type=click.FloatRange(0, 1), default=1.0,
+              help='Fraction of the queries that are checked, chosen at random.')
+@click.option('--since', type=click.DateTime(), default=None,
+              help='Only check queries that have been stored since this date.')
+@click.option('--report', type=click.Path(dir_okay=False), default=None,
+              help='File the JSON report is written to. If not set, it is printed.')
+def mongodatastore_check_integrity(workers, checkpoint, sample, since, report):
+    u'''Re-hash the result sets of the stored queries and compare them with their stored result set hash.
+    '''
     cntr = VersionedDataStoreController.get_instance()
-    error_list = []
-
-    start = datetime.utcnow()
-    for id in cntr.querystore.get_cursor_on_ids():
-        internal_id = int(id[0])
-        if not cntr.execute_stored_query(internal_id, 0, 0, True):
-            error_list.append(internal_id)
-            print('query {0} is not valid!'.format(internal_id))
-        else:
-            print('query {0} is valid!'.format(internal_id))
-
-    stop = datetime.utcnow()
-
-    print('integrity check stopped after {0} seconds'.format((stop - start).total_seconds()))
-    print('{0} problems detected'.format(len(error_list)))
-    if len(error_list) > 0:
-        print('The following PIDs do not retrieve a valid result set:')
-        for internal_id in error_list:
-            print(internal_id)
+    integrity_report = IntegrityReport(checkpoint)
+
+    check_integrity(cntr, integrity_report, workers, sample, since,
+                    on_result=lambda result: print('query {0} is {1}'.format(result['id'], result['status'])),
+                    get_controller=VersionedDataStoreController.get_instance)
+
+    integrity_report.close()
+    summary = integrity_report.summary()
+
+    print('integrity check stopped after {0:.1f} seconds: {1} queries checked ({2:.1f} queries/sec, {3:.0f} '
+          'rows/sec), {4} problems detected'.format(summary['seconds'], summary['checked'],
+                                                    summary['queries_per_second'], summary['rows_per_second'],
+                                                    len(summary['invalid'])))
+
+    if report:
+        with open(report, 'w', encoding='utf-8') as report_file:
+            json.dump(summary, report_file, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+@mongodatastore.command('mongodatastore_migrate_catalog')
+@click.help_option(u'-h', u'--help')
+@click.option('--drop-legacy', is_flag=True, default=False,
+              help='Drop the <id>_meta and <id>_fields collections after a resource has been migrated.')
+def mongodatastore_migrate_catalog(drop_legacy):
+    u'''Move the metadata and schema of all resources into the resource catalog.
+    '''
+    cntr = VersionedDataStoreController.get_instance()
+
+    migrated = 0
+    for resource_id in cntr.legacy_resource_ids():
+        if cntr.migrate_resource(resource_id, drop_legacy):
+            migrated += 1
+            print('resource {0} migrated'.format(resource_id))
+
+    print('{0} resources migrated'.format(migrated))
+
+
+@mongodatastore.command('mongodatastore_load')
+@click.help_option(u'-h', u'--help')
+@click.argument('resource_id')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(FILE_FORMATS), default=None,
+              help='Format of the input file. If not set, it is derived from the file extension.')
+@click.option('--delimiter', default=',', help='Delimiter of CSV files.')
+@click.option('--chunk-size', type=int, default=None,
+              help='Number of records that are kept in memory and written at once.')
+def mongodatastore_load(resource_id, path, file_format, delimiter, chunk_size):
+    u'''Stream the records of a CSV or JSONL file into an existing datastore resource.
+    '''
+    cntr = VersionedDataStoreController.get_instance()
+
+    if not cntr.resource_exists(resource_id):
+        raise click.ClickException('No datastore resource with id {0} exists. Create it with datastore_create '
+                                   'first.'.format(resource_id))
+
+    records = read_records(path, file_format, delimiter)
+
+    chunk_size = chunk_size or cntr.upsert_chunk_size
+
+    progress = LoadProgress(chunk_size * 10)
+    result = cntr.upsert(resource_id, progress.track(records), chunk_size=chunk_size)
+
+    print('loading finished after {0:.1f} seconds: {1} rows read ({2:.0f} rows/sec), {3} new record versions '
+          'written'.format(time.time() - progress.start, progress.count, progress.rate(), result['written']))
 
+    conversion_errors = result['conversion_errors']
+    if conversion_errors['count']:
+        print('{0} values could not be converted to their field type:'.format(conversion_errors['count']))
+        for error in conversion_errors['errors']:
+            print('row {row}, field {field}: {message}'.format(**error))
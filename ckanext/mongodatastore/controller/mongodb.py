@@ -1,55 +1,81 @@
+import copy
 import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import pymongo
 import pytz
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
 from ckan.common import config
 from ckan.plugins import toolkit
-from pymongo import MongoClient
-from pymongo.collation import Collation
-from pymongo.errors import BulkWriteError
+from pymongo import MongoClient, InsertOne, UpdateMany
+from pymongo.errors import BulkWriteError, OperationFailure
+from rq import get_current_job
 
+from ckanext.mongodatastore.artifacts import ArtifactStore
+from ckanext.mongodatastore.cache import LRUCache, ResultCache
 from ckanext.mongodatastore.controller.querystore import QueryStoreController
+from ckanext.mongodatastore.converter import SchemaConverter
+from ckanext.mongodatastore.ingest import IngestPipeline
+from ckanext.mongodatastore.merkle import MerkleLeaves, hash_leaf, merkle_root
 from ckanext.mongodatastore.exceptions import MongoDbControllerException, QueryNotFoundException
 from ckanext.mongodatastore.preprocessor import transform_query_to_statement, transform_filter_to_statement, transform_projection, \
-    transform_sort
-from ckanext.mongodatastore.util import HASH_ALGORITHM, calculate_hash
+    transform_sort, transform_seek, encode_cursor, decode_cursor, select_index_hint, add_key_fields, TEXT_SCORE_FIELD
+from ckanext.mongodatastore.util import DEFAULT_HASH_ALGORITHM, ResultSetHasher, calculate_hash, chunked, \
+    get_hash_algorithm
 
 log = logging.getLogger(__name__)
 
-type_conversion_dict = {
-    'string': str,
-    'str': str,
-    'text': str,
-    'char': str,
-    'integer': int,
-    'int': int,
-    'float': float,
-    'number': float,
-    'numeric': float,
-    'bigint': int
-}
+ESTIMATION_SAMPLE_SIZE = 1000
+
+# number of documents fetched per round trip when the hash of a result set is calculated
+HASH_BATCH_SIZE = 10000
+
+FULLTEXT_INDEX = '_fulltext_index'
+LATEST_INDEX = '{0}_latest_index'
+HISTORY_INDEX = '{0}_history_index'
+RECORD_ID_INDEX = '_record_id_latest_index'
+
+# one document per resource holding its metadata, schema and state, keyed by the resource id
+CATALOG_COLLECTION = 'resource_catalog'
+
+# queries stored before the result sets were hashed record by record got the MD5 hash of no data at all. Their result
+# sets can not be verified.
+LEGACY_RESULT_SET_HASH = 'd41d8cd98f00b204e9800998ecf8427e'
 
 
 def calculate_resultset_hash_job(internal_id):
-    client = MongoClient(config.get(u'ckan.datastore.write_url'))
-    querystore = QueryStoreController(config.get(u'ckanext.mongodatastore.querystore_url'))
+    # the controller, and with it the MongoDB client and the query store connection, is shared by all jobs of a
+    # non-forking worker. A forking worker runs every job in a new process, which creates its own controller.
+    cntr = VersionedDataStoreController.get_instance()
+    try:
+        cntr.hash_stored_query(internal_id)
+    finally:
+        cntr.querystore.remove_session()
 
-    q, metadata = querystore.retrieve_query_by_internal_id(internal_id)
-    c = client.get_database(config.get(u'ckanext.mongodatastore.database_name')).get_collection(q.resource_id)
-    stored_query = q.query
 
-    log.info("fetch {0}".format(stored_query['filter']))
+def upsert_job(resource_id, records, method, dry_run):
+    cntr = VersionedDataStoreController.get_instance()
+    job = get_current_job()
 
-    stored_query['filter'].update({
-        '_valid_to': {'$gt': q.timestamp},
-        '_created': {'$lte': q.timestamp}
-    })
+    def report_progress(stats):
+        if job:
+            job.meta['progress'] = stats
+            job.save_meta()
 
-    result = c.find(filter=stored_query['filter'], projection=stored_query['projection'], sort=stored_query['sort'])
+    operations = {
+        'insert': cntr.insert,
+        'upsert': cntr.upsert
+    }
 
-    _hash = calculate_hash(result)
-    querystore.update_hash(internal_id, _hash)
+    return operations[method](resource_id, records, dry_run, progress=report_progress)
 
 
 class VersionedDataStoreController:
@@ -59,91 +85,356 @@ class VersionedDataStoreController:
     instance = None
 
     class __VersionedDataStoreController:
-        def __init__(self, client, database_name, sharding_enabled, querystore, rows_max, queue_name, ckan_site_url):
+        def __init__(self, client, database_name, sharding_enabled, querystore, rows_max, queue_name, ckan_site_url,
+                     upsert_chunk_size=1000, hash_algorithm=DEFAULT_HASH_ALGORITHM, ingest_workers=0,
+                     ingest_max_in_flight=None, ingest_queue_name='ingest_queue', async_upsert_threshold=0,
+                     fulltext_mode='text', fulltext_language='english', schema_cache_size=1000,
+                     schema_cache_ttl=10, result_cache_size=0, result_cache_dir=None, result_cache_disk_size=10000,
+                     stream_batch_size=5000, artifact_dir=None, artifact_compression=True, merkle_leaf_size=0,
+                     merkle_workers=4):
+            # the process the clients were created in, they can not be used by a forked process
+            self.pid = os.getpid()
             self.client = client
             self.datastore = self.client.get_database(database_name)
+            self.catalog = self.datastore.get_collection(CATALOG_COLLECTION)
             self.sharding_enabled = sharding_enabled
             self.querystore = querystore
             self.rows_max = rows_max
             self.queue_name = queue_name
             self.ckan_site_url = ckan_site_url
+            self.upsert_chunk_size = upsert_chunk_size
+            self.hash_algorithm = hash_algorithm
+            self.ingest_pipeline = IngestPipeline(ingest_workers, ingest_max_in_flight)
+            self.ingest_queue_name = ingest_queue_name
+            self.async_upsert_threshold = async_upsert_threshold
+            self.fulltext_mode = fulltext_mode
+            self.fulltext_language = fulltext_language
+            self.converters = LRUCache(schema_cache_size)
+            self.schema_cache = LRUCache(schema_cache_size)
+            self.schema_cache_ttl = schema_cache_ttl
+            self.index_cache = LRUCache(schema_cache_size)
+            self.result_cache = ResultCache(result_cache_size, result_cache_dir, result_cache_disk_size)
+            self.stream_batch_size = stream_batch_size
+            self.artifact_store = ArtifactStore(artifact_dir, artifact_compression) if artifact_dir else None
+            self.merkle_leaf_size = merkle_leaf_size
+            self.merkle_workers = merkle_workers
+
+        def __schema_converter(self, resource_id, meta_entry):
+            schema_hash = meta_entry.get('schema_hash')
+
+            cached = self.converters.get(resource_id)
+            if schema_hash and cached and cached[0] == schema_hash:
+                return cached[1]
+
+            # the schema is read together with its hash, the schema cached by resource_fields may still be the one
+            # from before another process changed it
+            schema_entry = self._get_catalog_entry(resource_id, {'schema': 1, 'schema_hash': 1}) or {}
+            schema_hash = schema_entry.get('schema_hash')
+
+            converter = SchemaConverter(schema_entry.get('schema', []))
+            if schema_hash:
+                self.converters.put(resource_id, (schema_hash, converter))
+            return converter
 
         @staticmethod
-        def __apply_override_type(records, fields):
-            field_type = dict()
+        def __log_conversion_report(resource_id, report):
+            if len(report):
+                log.warning('%s values of resource %s could not be converted to their field type, e.g. %s',
+                            len(report), resource_id, report.errors[0])
 
-            for field in fields.find():
-                if 'info' in field and 'type_override' in field['info']:
-                    if field['info']['type_override'] in type_conversion_dict:
-                        field_type[field['id']] = type_conversion_dict[field['info']['type_override']]
-                else:
-                    field_type[field['id']] = type_conversion_dict[field['type']]
+        @staticmethod
+        def __check_record_ids(records, record_id_key):
+            records_without_id = [record for record in records if record_id_key not in record.keys()]
 
-            for record in records:
-                for field in record.keys():
-                    if record[field]:
-                        if field_type[field] in [float, int] and (record[field] == '' or str(record[field]).isspace()):
-                            record[field] = None
-                        else:
-                            try:
-                                record[field] = field_type[field](record[field])
-                            except ValueError as e:
-                                print(e)
-
-        def __update_required(self, resource_id, new_record, id_key):
+            if len(records_without_id) > 0:
+                raise MongoDbControllerException('For a datastore upsert, an id '
+                                                 'value has to be set for every record. '
+                                                 'In this collection the id attribute is "{0}"'.format(record_id_key))
+
+        def __count_live_records(self, resource_id, delta):
+            # approximate number of current records, used for estimating the total of unfiltered searches. It is only
+            # maintained for resources that were created with a counter.
+            self.catalog.update_one({'_id': resource_id, 'live_records': {'$exists': True}},
+                                    {'$inc': {'live_records': delta}})
+
+        def __invalidate_resource(self, resource_id):
+            # the version counter tells the other processes to reload their cached schema and metadata
+            self.schema_cache.pop(resource_id)
+            self.index_cache.pop(resource_id)
+            self.catalog.update_one({'_id': resource_id}, {'$inc': {'metadata_version': 1}})
+
+        def __ensure_record_id_index(self, resource_id, record_id_key):
+            # resources created before the index was introduced get it with their first upsert
+            if RECORD_ID_INDEX in self._index_information(resource_id):
+                return
+
+            self._get_resource_collection(resource_id).create_index(
+                [(record_id_key, pymongo.ASCENDING), ('_latest', pymongo.DESCENDING)], name=RECORD_ID_INDEX)
+            self.index_cache.pop(resource_id)
+
+        def __count_write(self, resource_id):
+            # every write changes the version of the resource's data, which invalidates the cached query results
+            self.catalog.update_one({'_id': resource_id}, {'$inc': {'write_version': 1}})
+
+        def __result_cache_key(self, resource_id, *parts):
+            if not self.result_cache.enabled:
+                return None
+
+            entry = self.catalog.find_one({'_id': resource_id}, {'write_version': 1})
+            write_version = entry.get('write_version', 0) if entry else 0
+
+            return self.result_cache.key(resource_id, write_version, *parts)
+
+        @staticmethod
+        def __new_batch():
+            # every write shares one transaction timestamp, which is used for both, the _created stamp of new versions
+            # and the _valid_to stamp of the versions they replace. MongoDB only stores milliseconds.
+            now = datetime.utcnow()
+            return ObjectId(), now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+        @staticmethod
+        def __latest_hashes(col, id_key, ids):
+            cursor = col.find({id_key: {'$in': ids}, '_latest': True},
+                              {id_key: 1, '_hash': 1, '_hash_algorithm': 1, '_id': 0})
+            return {doc[id_key]: (doc.get('_hash'), doc.get('_hash_algorithm', DEFAULT_HASH_ALGORITHM))
+                    for doc in cursor}
+
+        def __update_required(self, record, record_hash, latest_entry):
+            if latest_entry is None:
+                return True
+
+            latest_hash, latest_algorithm = latest_entry
+            if latest_algorithm != self.hash_algorithm:
+                # the latest version was hashed with another algorithm, which is used for the comparison
+                try:
+                    record_hash = calculate_hash(record, latest_algorithm)
+                except ValueError:
+                    return True
+
+            return latest_hash != record_hash
+
+        def __upsert_chunk(self, col, records, hashes, id_key, batch_id, timestamp):
+            # if a record id occurs more than once within a chunk, only its last occurrence is kept
+            chunk = OrderedDict()
+            for record, record_hash in zip(records, hashes):
+                chunk[record[id_key]] = (record, record_hash)
+
+            latest = self.__latest_hashes(col, id_key, list(chunk.keys()))
+
+            required_updates = []
+            for record_id, (record, record_hash) in chunk.items():
+                if self.__update_required(record, record_hash, latest.get(record_id)):
+                    record['_hash'] = record_hash
+                    record['_hash_algorithm'] = self.hash_algorithm
+                    required_updates.append(record)
+
+            if not required_updates:
+                return 0, 0
+
+            outdated_ids = [record[id_key] for record in required_updates if record[id_key] in latest]
+
+            operations = []
+            if outdated_ids:
+                operations.append(UpdateMany({id_key: {'$in': outdated_ids}, '_latest': True},
+                                             {'$set': {'_valid_to': timestamp, '_latest': False}}))
+
+            for record in required_updates:
+                record['_batch_id'] = batch_id
+                record['_created'] = timestamp
+                record['_latest'] = True
+                record['_valid_to'] = datetime.max
+                operations.append(InsertOne(record))
+
+            col.bulk_write(operations, ordered=True)
+            return len(required_updates), len(required_updates) - len(outdated_ids)
+
+        def _count(self, resource_id, statement, total_estimation_threshold=None):
             col = self._get_resource_collection(resource_id)
 
-            result = col.find_one(
-                {'_latest': True, '_hash': new_record['_hash'], id_key: new_record[id_key]}, {'_hash': 1})
-            return result is None
+            if total_estimation_threshold is None:
+                return {'total': col.count_documents(statement)}
+
+            if statement == {'_latest': True}:
+                meta_entry = self._get_catalog_entry(resource_id, {'live_records': 1})
+                live_records = meta_entry.get('live_records') if meta_entry else None
+                if live_records is not None and live_records > total_estimation_threshold:
+                    return {'total': live_records, 'total_was_estimated': True}
+
+            total = col.count_documents(statement, limit=total_estimation_threshold + 1)
+            if total <= total_estimation_threshold:
+                return {'total': total, 'total_was_estimated': False}
+
+            if '$text' in statement:
+                # a text search has to be the first stage of a pipeline, so it can not be applied to a sample
+                return {'total': total, 'total_was_estimated': True}
+
+            # the exact count exceeds the threshold, the total is extrapolated from a random sample of the collection
+            sample = list(col.aggregate([{'$sample': {'size': ESTIMATION_SAMPLE_SIZE}},
+                                         {'$match': statement},
+                                         {'$count': 'matches'}]))
+            matches = sample[0]['matches'] if sample else 0
+            estimate = int(col.estimated_document_count() * matches / ESTIMATION_SAMPLE_SIZE)
+
+            return {'total': max(estimate, total), 'total_was_estimated': True}
+
+        def _execute_query(self, resource_id, statement, projection, sort, offset, limit, include_total,
+                           cursor=None, total_estimation_threshold=None):
+            cache_key = self.__result_cache_key(resource_id, 'find', statement, projection, sort, offset, limit,
+                                                include_total, cursor, total_estimation_threshold)
+            if cache_key:
+                result = self.result_cache.get(cache_key)
+                if result is not None:
+                    return result
 
-        def _execute_query(self, resource_id, statement, projection, sort, offset, limit, include_total):
             result = dict()
             col = self._get_resource_collection(resource_id)
 
-            cursor = col.find(statement, projection=projection, skip=offset,
-                              limit=limit, sort=sort)
+            if include_total:
+                result.update(self._count(resource_id, statement, total_estimation_threshold))
+
+            # results sorted by text score can only be paged with offset, as the score can not be filtered on
+            seekable = all(type(direction) is int for _, direction in sort)
 
-            result['records'] = cursor
+            if cursor:
+                if not seekable:
+                    raise MongoDbControllerException('Results ordered by text score can not be paged with a cursor')
 
-            if include_total:
-                result.update({'total': col.count_documents(statement)})
+                try:
+                    last_key = decode_cursor(cursor, sort)
+                except ValueError as e:
+                    raise MongoDbControllerException(str(e))
+
+                statement = {'$and': [statement, transform_seek(sort, last_key)]}
+                offset = 0
+
+            # the sort keys of every record are fetched as well, so the last record of the page can be turned into
+            # the cursor of the next page
+            sort_fields = [field for field, _ in sort]
+            fetch_projection, hidden_fields = add_key_fields(projection, sort_fields)
+
+            records = list(col.find(statement, projection=fetch_projection or None, skip=offset, limit=limit,
+                                    sort=sort))
+
+            if seekable and limit and len(records) == limit:
+                result['next_page'] = encode_cursor(sort, [records[-1].get(field) for field in sort_fields])
+
+            for record in records:
+                for field in hidden_fields:
+                    record.pop(field, None)
+
+            result['records'] = records
+
+            if cache_key:
+                self.result_cache.put(cache_key, result)
 
             return result
 
-        def _execute_distinct_query(self, resource_id, field, offset=0, limit=None):
+        def _execute_distinct_query(self, resource_id, field, statement, offset=0, limit=None, include_counts=False):
+            cache_key = self.__result_cache_key(resource_id, 'distinct', field, statement, offset, limit,
+                                                include_counts)
+            if cache_key:
+                result = self.result_cache.get(cache_key)
+                if result is not None:
+                    return result
+
             col = self._get_resource_collection(resource_id)
-            return {'records': list(map(lambda x: {field: x}, col.distinct(key=field)))[offset:limit]}
+
+            pipeline = [{'$match': statement},
+                        {'$group': {'_id': '${0}'.format(field), 'count': {'$sum': 1}}}]
+
+            if include_counts:
+                pipeline.append({'$sort': {'count': pymongo.DESCENDING, '_id': pymongo.ASCENDING}})
+            else:
+                pipeline.append({'$sort': {'_id': pymongo.ASCENDING}})
+
+            if offset:
+                pipeline.append({'$skip': offset})
+            if limit:
+                pipeline.append({'$limit': limit})
+
+            records = []
+            for entry in col.aggregate(pipeline, allowDiskUse=True):
+                record = {field: entry['_id']}
+                if include_counts:
+                    record['_count'] = entry['count']
+                records.append(record)
+
+            result = {'records': records}
+
+            if cache_key:
+                self.result_cache.put(cache_key, result)
+
+            return result
 
         def _get_resource_collection(self, resource_id):
             return self.datastore.get_collection(resource_id)
 
-        def _get_resource_metadata(self, resource_id):
-            collection_name = '{0}_meta'.format(resource_id)
-            return self.datastore.get_collection(collection_name)
+        def _index_information(self, resource_id):
+            # indexes only change with the schema, they are cached for the same time as the schema
+            entry = self.index_cache.get(resource_id)
+            now = time.monotonic()
+
+            if entry and now - entry['loaded'] < self.schema_cache_ttl:
+                return entry['indexes']
+
+            indexes = self._get_resource_collection(resource_id).index_information()
+            self.index_cache.put(resource_id, {'indexes': indexes, 'loaded': now})
+
+            return indexes
+
+        def _get_legacy_collections(self, resource_id):
+            # before the catalog was introduced, metadata and schema were stored in two collections per resource
+            return (self.datastore.get_collection('{0}_meta'.format(resource_id)),
+                    self.datastore.get_collection('{0}_fields'.format(resource_id)))
+
+        def _get_catalog_entry(self, resource_id, projection=None):
+            entry = self.catalog.find_one({'_id': resource_id}, projection)
+
+            if entry is None and self.migrate_resource(resource_id):
+                entry = self.catalog.find_one({'_id': resource_id}, projection)
 
-        def _get_resource_fields(self, resource_id):
-            collection_name = '{0}_fields'.format(resource_id)
-            return self.datastore.get_collection(collection_name)
+            return entry
+
+        def migrate_resource(self, resource_id, drop_legacy=False):
+            meta, fields = self._get_legacy_collections(resource_id)
+
+            meta_entry = meta.find_one({}, {'_id': 0})
+            if meta_entry is None:
+                return False
+
+            meta_entry['schema'] = list(fields.find({}, {'_id': 0}))
+            self.catalog.update_one({'_id': resource_id}, {'$setOnInsert': meta_entry}, upsert=True)
+
+            if drop_legacy:
+                meta.drop()
+                fields.drop()
+
+            log.info('migrated resource %s into the resource catalog', resource_id)
+            return True
+
+        def legacy_resource_ids(self):
+            return [name[:-len('_meta')] for name in self.datastore.list_collection_names() if name.endswith('_meta')]
 
         def get_all_ids(self):
-            return [name for name in self.datastore.list_collection_names() if
-                    not (name.endswith('_meta') or name.endswith('_fields'))]
+            # deleted resources keep their catalog entry for the issued PIDs, but are no longer part of the datastore
+            return [entry['_id'] for entry in self.catalog.find({'active': True}, {'_id': 1})]
 
         def resource_exists(self, resource_id):
-            return resource_id in self.datastore.list_collection_names()
+            entry = self._get_catalog_entry(resource_id, {'active': 1})
+            return bool(entry and entry.get('active'))
 
         def create_resource(self, resource_id, primary_key):
-            if resource_id not in self.datastore.list_collection_names():
-                self.datastore.create_collection(resource_id)
-                self.datastore.create_collection('{0}_meta'.format(resource_id))
+            entry = self._get_catalog_entry(resource_id, {'record_id': 1})
+
+            if entry is None or 'record_id' not in entry:
+                self.catalog.update_one({'_id': resource_id}, {'$set': {'live_records': 0}}, upsert=True)
 
             if self.sharding_enabled:
                 self.client.admin.command('shardCollection', 'CKAN_Datastore.{0}'.format(resource_id),
                                           key={'_id': 'hashed'})
 
-            self.datastore.get_collection('{0}_meta'.format(resource_id)).insert_one(
-                {'record_id': primary_key, 'active': True})
+            self.catalog.update_one({'_id': resource_id}, {'$set': {'record_id': primary_key, 'active': True}},
+                                    upsert=True)
 
             col = self.datastore.get_collection(resource_id)
 
@@ -154,17 +445,29 @@ class VersionedDataStoreController:
             col.create_index([('_latest', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)],
                              name='_valid_to_pk_index')
 
-        def delete_resource(self, resource_id, filters={}):
+            col.create_index([(primary_key, pymongo.ASCENDING), ('_latest', pymongo.DESCENDING)],
+                             name=RECORD_ID_INDEX)
+
+            self.__invalidate_resource(resource_id)
+
+        def delete_resource(self, resource_id, filters=None):
             col = self._get_resource_collection(resource_id)
-            filters.update({'_latest': True})
-            col.update_many(filters, {'$currentDate': {'_valid_to': True}, '$set': {'_latest': False}})
+            statement = dict(filters or {}, _latest=True)
+            _, timestamp = self.__new_batch()
+            result = col.update_many(statement, {'$set': {'_valid_to': timestamp, '_latest': False}})
+            self.__count_live_records(resource_id, -result.modified_count)
+            self.__count_write(resource_id)
+
+            if not filters:
+                # deleting without filters deletes the resource, its history is kept for the issued PIDs
+                self.catalog.update_one({'_id': resource_id}, {'$set': {'active': False}})
+
+            self.__invalidate_resource(resource_id)
 
         def update_schema(self, resource_id, field_definitions, indexes, primary_key):
             collection = self._get_resource_collection(resource_id)
-            fields = self._get_resource_fields(resource_id)
 
-            fields.delete_many({})
-            fields.insert_many(field_definitions)
+            schema_hash = calculate_hash(field_definitions)
 
             type_dict = {}
             text_fields = []
@@ -174,188 +477,438 @@ class VersionedDataStoreController:
                     text_fields.append(field['id'])
                 type_dict[field['id']] = field['type']
 
+            meta_entry = self._get_catalog_entry(resource_id, {'fulltext_fields': 1}) or {}
+            fulltext_fields = sorted(text_fields)
+
+            if meta_entry.get('fulltext_fields') != fulltext_fields:
+                if FULLTEXT_INDEX in collection.index_information():
+                    collection.drop_index(FULLTEXT_INDEX)
+                if fulltext_fields:
+                    collection.create_index([(field, pymongo.TEXT) for field in fulltext_fields], name=FULLTEXT_INDEX,
+                                            default_language=self.fulltext_language)
+
+            self.catalog.update_one({'_id': resource_id},
+                                    {'$set': {'schema': field_definitions, 'schema_hash': schema_hash,
+                                              'fulltext_fields': fulltext_fields},
+                                     '$inc': {'metadata_version': 1}},
+                                    upsert=True)
+            self.schema_cache.pop(resource_id)
+            self.index_cache.pop(resource_id)
+
+            # a missing or empty value leaves the indexes of the resource unchanged
             if indexes:
-                for index in indexes:
-                    if index != primary_key and index not in text_fields:
-                        collection.create_index([(index, pymongo.ASCENDING)], name='{0}_index'.format(index))
-                    else:
-                        collection.create_index([(field['id'], 1)], collation=Collation(locale='en'))
-            for field in field_definitions:
-                field.pop('_id')
+                self.__sync_field_indexes(collection, indexes)
 
-        def insert(self, resource_id, records, dry_run=False):
+        @staticmethod
+        def __sync_field_indexes(collection, indexes):
+            # every declared index is created twice: a partial index only covering the current versions, which is used
+            # by searches on the latest data, and a compound index for queries at a point in time (stored queries).
+            existing = collection.index_information()
+
+            for field in indexes:
+                for legacy_index in ['{0}_index'.format(field), '{0}_1'.format(field)]:
+                    if legacy_index in existing:
+                        collection.drop_index(legacy_index)
+
+                collection.create_index([(field, pymongo.ASCENDING)], name=LATEST_INDEX.format(field),
+                                        partialFilterExpression={'_latest': True})
+                collection.create_index([(field, pymongo.ASCENDING), ('_created', pymongo.ASCENDING),
+                                         ('_valid_to', pymongo.ASCENDING)], name=HISTORY_INDEX.format(field))
+
+            for name, info in existing.items():
+                field = info['key'][0][0]
+                if field not in indexes and name in [LATEST_INDEX.format(field), HISTORY_INDEX.format(field)]:
+                    collection.drop_index(name)
+
+        def insert(self, resource_id, records, dry_run=False, chunk_size=None, progress=None):
             col = self._get_resource_collection(resource_id)
-            meta = self._get_resource_metadata(resource_id)
-            fields = self._get_resource_fields(resource_id)
+            meta_entry = self._get_catalog_entry(resource_id, {'schema': 0})
 
-            record_id_key = meta.find_one()['record_id']
+            record_id_key = meta_entry['record_id']
+            converter = self.__schema_converter(resource_id, meta_entry)
 
-            self.__apply_override_type(records, fields)
+            if type(records) is list:
+                self.__check_record_ids(records, record_id_key)
 
-            records_without_id = [record for record in records if record_id_key not in record.keys()]
+            chunk_size = chunk_size or self.upsert_chunk_size
+            batch_id, _ = self.__new_batch()
+            stats = {'records': 0, 'written': 0}
 
-            if len(records_without_id) > 0:
-                raise MongoDbControllerException('For a datastore upsert, an id '
-                                                 'value has to be set for every record. '
-                                                 'In this collection the id attribute is "{0}"'.format(record_id_key))
+            def write(chunk, hashes):
+                self.__check_record_ids(chunk, record_id_key)
+                stats['records'] += len(chunk)
 
-            if not dry_run:
-                for record in records:
-                    record['_hash'] = calculate_hash(record)
-                    record['_valid_to'] = datetime.max
+                if not dry_run:
+                    _, timestamp = self.__new_batch()
+                    for record, record_hash in zip(chunk, hashes):
+                        record['_hash'] = record_hash
+                        record['_hash_algorithm'] = self.hash_algorithm
+                        record['_batch_id'] = batch_id
+                        record['_created'] = timestamp
+                        record['_latest'] = True
+                        record['_valid_to'] = datetime.max
 
-                try:
-                    col.insert_many(records)
-                    col.update_many({'_created': {'$exists': False}},
-                                    {'$currentDate': {'_created': True},
-                                     '$set': {'_latest': True}})
-                except BulkWriteError as bwe:
-                    log.error(bwe.details)
-
-        def upsert(self, resource_id, records, dry_run=False):
+                    try:
+                        col.insert_many(chunk)
+                        inserted = len(chunk)
+                    except BulkWriteError as bwe:
+                        log.error(bwe.details)
+                        inserted = bwe.details.get('nInserted', 0)
+
+                    if inserted:
+                        stats['written'] += inserted
+                        self.__count_live_records(resource_id, inserted)
+                        self.__count_write(resource_id)
+
+                if progress:
+                    progress(dict(stats))
+
+            # like upserts, the records are converted and hashed by the ingest pipeline
+            parallel = type(records) is not list or len(records) > chunk_size
+            report = self.ingest_pipeline.run(chunked(records, chunk_size), converter,
+                                              None if dry_run else self.hash_algorithm, write, parallel)
+            self.__log_conversion_report(resource_id, report)
+
+            stats['conversion_errors'] = report.as_dict()
+            if progress:
+                progress(stats)
+
+            return stats
+
+        def upsert(self, resource_id, records, dry_run=False, chunk_size=None, progress=None):
             col = self._get_resource_collection(resource_id)
-            meta = self._get_resource_metadata(resource_id)
-            fields = self._get_resource_fields(resource_id)
+            meta_entry = self._get_catalog_entry(resource_id, {'schema': 0})
 
-            record_id_key = meta.find_one()['record_id']
+            record_id_key = meta_entry['record_id']
+            converter = self.__schema_converter(resource_id, meta_entry)
 
-            self.__apply_override_type(records, fields)
+            if not dry_run:
+                self.__ensure_record_id_index(resource_id, record_id_key)
 
-            records_without_id = [record for record in records if record_id_key not in record.keys()]
+            # records may also be an iterator (e.g. streamed from a file), which is then consumed chunk by chunk
+            if type(records) is list:
+                self.__check_record_ids(records, record_id_key)
 
-            if len(records_without_id) > 0:
-                raise MongoDbControllerException('For a datastore upsert, an id '
-                                                 'value has to be set for every record. '
-                                                 'In this collection the id attribute is "{0}"'.format(record_id_key))
+            chunk_size = chunk_size or self.upsert_chunk_size
+            batch_id, _ = self.__new_batch()
+            stats = {'records': 0, 'written': 0}
+            new_records = 0
+
+            def write(chunk, hashes):
+                nonlocal new_records
+                self.__check_record_ids(chunk, record_id_key)
+                stats['records'] += len(chunk)
 
-            required_updates = []
-            for record in records:
                 if not dry_run:
-                    record['_hash'] = calculate_hash(record)
-                    if self.__update_required(resource_id, record, record_id_key):
-                        record['_latest'] = True
-                        record['_valid_to'] = datetime.max
-                        required_updates.append(record)
-
-            if required_updates:
-                col.update_many({'id': {'$in': [record[record_id_key] for record in required_updates]},
-                                 '_latest': True},
-                                {'$currentDate': {'_valid_to': True},
-                                 '$set': {'_latest': False}})
-                col.insert_many(required_updates)
-                col.update_many({'_created': {'$exists': False}},
-                                {'$currentDate': {'_created': True},
-                                 '$set': {'_latest': True}})
-
-        def issue_pid(self, resource_id, statement, projection, sort, q):
+                    # every chunk is stamped when it is written. A PID issued while a long upsert is running must not
+                    # see the chunks written after it, which a timestamp taken at the start of the upsert would allow.
+                    _, timestamp = self.__new_batch()
+                    written, inserted = self.__upsert_chunk(col, chunk, hashes, record_id_key, batch_id, timestamp)
+                    stats['written'] += written
+                    new_records += inserted
+                    if written:
+                        self.__count_write(resource_id)
+
+                if progress:
+                    progress(dict(stats))
+
+            parallel = type(records) is not list or len(records) > chunk_size
+            report = self.ingest_pipeline.run(chunked(records, chunk_size), converter,
+                                              None if dry_run else self.hash_algorithm, write, parallel)
+
+            if new_records:
+                self.__count_live_records(resource_id, new_records)
+
+            self.__log_conversion_report(resource_id, report)
+
+            stats['conversion_errors'] = report.as_dict()
+            if progress:
+                progress(stats)
+
+            return stats
+
+        def enqueue_upsert(self, resource_id, records, method='upsert', dry_run=False):
+            job = toolkit.enqueue_job(upsert_job, [resource_id, records, method, dry_run],
+                                      title='{0} of {1} records into {2}'.format(method, len(records), resource_id),
+                                      queue=self.ingest_queue_name)
+            return job.id
+
+        def issue_pid(self, resource_id, statement, projection, sort, q, fulltext_mode=None):
             now = datetime.now(pytz.UTC)
 
-            fields = self._get_resource_fields(resource_id)
-            schema = fields.find()
+            resource_fields = self.resource_fields(resource_id)
+            schema = resource_fields['schema']
 
             if q:
-                statement = transform_query_to_statement(q, schema)
+                # a $text statement depends on the text index, which is rebuilt over other fields when the text fields
+                # of the resource change. A stored query must stay reproducible, so text searches are stored as prefix
+                # searches over the current text fields.
+                fulltext_mode = fulltext_mode or self.fulltext_mode
+                if fulltext_mode == 'text':
+                    fulltext_mode = 'prefix'
+                statement = self.__fulltext_statement(resource_fields, q, fulltext_mode)
             else:
                 statement = transform_filter_to_statement(statement, schema)
 
-            projection = transform_projection(projection, fields.find())
+            projection = transform_projection(projection, schema)
 
             sort = transform_sort(sort)
 
-            fields_metadata = [field for field in fields.find() if field[u'id'] in projection.keys()]
+            fields_metadata = [field for field in schema if field[u'id'] in projection.keys()]
 
             query, meta_data = self.querystore.store_query(resource_id,
                                                            {'filter': statement,
                                                             'projection': projection,
                                                             'sort': sort},
                                                            str(now),
-                                                           None, HASH_ALGORITHM().name,
+                                                           None, self.hash_algorithm,
                                                            fields_metadata)
 
             toolkit.enqueue_job(calculate_resultset_hash_job, [query.id], queue=self.queue_name)
 
             return query.id
 
-        def execute_stored_query(self, id, offset, limit, include_data=False):
-            log.debug("execute_stored_query")
-
+        def __resolve_stored_query(self, id):
             if type(id) in [str] and id.isdigit() or type(id) == int:
                 q, metadata = self.querystore.retrieve_query_by_internal_id(int(id))
             else:
                 q, metadata = self.querystore.retrieve_query_by_pid(id)
 
-            if q:
-                log.debug("query found")
-                col = self._get_resource_collection(q.resource_id)
-
-                stored_query = {
-                    '_valid_to': {'$gt': q.timestamp},
-                    '_created': {'$lte': q.timestamp}
-                }
-                result = dict()
-
-                if include_data:
-                    stored_query.update(q.query['filter'])
-                    if '_created_valid_to_index' in col.index_information().keys():
-                        result['records'] = list(col.find(filter=stored_query,
-                                                          projection=q.query.get('projection'),
-                                                          sort=q.query.get('sort'),
-                                                          skip=offset,
-                                                          limit=limit,
-                                                          hint='_created_valid_to_index'))
-                    else:
-                        result['records'] = list(col.find(filter=stored_query,
-                                                          projection=q.query.get('projection'),
-                                                          sort=q.query.get('sort'),
-                                                          skip=offset,
-                                                          limit=limit))
-
-                result['query'] = q.as_dict()
-
-                fields = []
-                field_names = []
-                for field in q.record_fields:
-                    field_names.append(field.name)
-                    fields.append({
-                        'id': field.name,
-                        'type': field.datatype,
-                        'info': {
-                            'description': field.description
-                        }
-                    })
-
-                result['fields'] = fields
-                result['meta'] = metadata
-
-                return result
-            else:
+            if not q:
                 log.debug("query not found")
                 raise QueryNotFoundException('No query with PID {0} found'.format(id))
 
+            log.debug("query found")
+            return q, metadata
+
+        @staticmethod
+        def __stored_query_fields(q):
+            fields = []
+            for field in q.record_fields:
+                fields.append({
+                    'id': field.name,
+                    'type': field.datatype,
+                    'info': {
+                        'description': field.description
+                    }
+                })
+            return fields
+
+        def __stored_query_records(self, q, offset=0, limit=0, batch_size=0, raw=False, projection=None,
+                                   after_key=None):
+            col = self._get_resource_collection(q.resource_id)
+            if raw:
+                col = col.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+
+            stored_query = {
+                '_valid_to': {'$gt': q.timestamp},
+                '_created': {'$lte': q.timestamp}
+            }
+            stored_query.update(q.query['filter'])
+
+            if after_key is not None:
+                stored_query = {'$and': [stored_query, transform_seek(q.query['sort'], after_key)]}
+
+            # text searches of queries stored by earlier versions always use the text index, they can not be combined
+            # with a hint
+            if '$text' in q.query['filter']:
+                hint = None
+            else:
+                hint = select_index_hint(stored_query, self._index_information(q.resource_id))
+
+            def find(index_hint):
+                cursor = col.find(filter=stored_query,
+                                  projection=projection or q.query.get('projection'),
+                                  sort=q.query.get('sort'),
+                                  skip=offset,
+                                  limit=limit,
+                                  batch_size=batch_size,
+                                  hint=index_hint)
+                # the first batch is fetched right away, so an invalid hint is detected before records are yielded
+                return cursor, next(cursor, None)
+
+            try:
+                cursor, record = find(hint)
+            except OperationFailure:
+                if hint is None:
+                    raise
+                # the cached index information is outdated, the index was dropped by another process
+                self.index_cache.pop(q.resource_id)
+                cursor, record = find(None)
+
+            try:
+                while record is not None:
+                    yield record
+                    record = next(cursor, None)
+            finally:
+                cursor.close()
+
+        def execute_stored_query(self, id, offset, limit, include_data=False):
+            log.debug("execute_stored_query")
+
+            q, metadata = self.__resolve_stored_query(id)
+            result = dict()
+
+            if include_data:
+                result['records'] = list(self.__stored_query_records(q, offset, limit))
+
+            result['query'] = q.as_dict()
+            result['fields'] = self.__stored_query_fields(q)
+            result['meta'] = metadata
+
+            return result
+
+        def __hash_result_set(self, q, leaf_size=0):
+            algorithm = q.hash_algorithm or DEFAULT_HASH_ALGORITHM
+            hasher = ResultSetHasher(algorithm)
+
+            # the leaves are hashed in the same ordered pass as the result set hash, which the PID requires anyway and
+            # which provides the leaf boundaries. Only the verification fetches the leaves on separate cursors.
+            # With fingerprints enabled, the sort keys are fetched as well, as they mark where the leaves end.
+            sort_fields = [field for field, _ in q.query.get('sort') or []] if leaf_size else []
+            projection, hidden_fields = add_key_fields(q.query.get('projection'), sort_fields)
+            leaves = MerkleLeaves(leaf_size, algorithm)
+
+            # the documents are fetched undecoded, which provides their size without encoding them again
+            for document in self.__stored_query_records(q, batch_size=HASH_BATCH_SIZE, raw=True,
+                                                        projection=projection):
+                record = bson.decode(document.raw)
+
+                if leaf_size:
+                    key = [record.get(field) for field in sort_fields]
+                    for field in hidden_fields:
+                        record.pop(field, None)
+                    leaves.update(record, key)
+
+                hasher.update(record, len(bson.encode(record)) if hidden_fields else len(document.raw))
+
+            return hasher, leaves
+
+        def hash_stored_query(self, id):
+            q, _ = self.__resolve_stored_query(id)
+            hasher, leaves = self.__hash_result_set(q, self.merkle_leaf_size)
+
+            log.info('result set of query %s: %s rows, %s bytes', q.id, hasher.count, hasher.size)
+            self.querystore.update_hash(q.id, hasher.hexdigest(), hasher.count, hasher.size)
+
+            if self.merkle_leaf_size:
+                leaves.finish()
+                self.querystore.store_leaves(q.id, self.merkle_leaf_size, leaves.root(),
+                                             [dict(leaf, last_key=json_util.dumps(leaf['last_key']))
+                                              for leaf in leaves.leaves])
+
+        def check_stored_query(self, q):
+            # re-hashes the result set of a stored query and compares it with the hash calculated when the query was
+            # stored. Queries whose hash job has not finished yet can not be checked.
+            if not q.result_set_hash:
+                return {'id': q.id, 'pid': q.handle_pid, 'status': 'pending'}
+
+            start = time.time()
+            hasher, _ = self.__hash_result_set(q)
+
+            if hasher.hexdigest() == q.result_set_hash:
+                status = 'valid'
+            elif q.result_set_hash == LEGACY_RESULT_SET_HASH and q.result_set_rows is None:
+                status = 'legacy'
+            else:
+                status = 'invalid'
+
+            return {
+                'id': q.id,
+                'pid': q.handle_pid,
+                'status': status,
+                'rows': hasher.count,
+                'bytes': hasher.size,
+                'seconds': time.time() - start
+            }
+
+        def verify_stored_query(self, id, positions=None):
+            # verifies the result set of a query leaf by leaf. Every leaf is fetched with its own cursor, starting after
+            # the last key of the previous leaf, so the leaves are verified in parallel and a difference is localised
+            # to the leaves it affects. The position after the last leaf stands for records appended to the result.
+            q, _ = self.__resolve_stored_query(id)
+            if not q.merkle_root:
+                raise MongoDbControllerException('Query {0} has no result set fingerprint'.format(q.id))
+
+            algorithm = q.hash_algorithm or DEFAULT_HASH_ALGORITHM
+            leaves = self.querystore.retrieve_leaves(q.id)
+            last_keys = [json_util.loads(leaf.last_key) for leaf in leaves]
+
+            if positions is None:
+                positions = range(len(leaves) + 1)
+
+            def verify_leaf(position):
+                after_key = last_keys[position - 1] if position > 0 else None
+
+                if position == len(leaves):
+                    return next(self.__stored_query_records(q, limit=1, after_key=after_key), None) is None
+
+                leaf = leaves[position]
+                records = self.__stored_query_records(q, limit=leaf.row_count, batch_size=leaf.row_count,
+                                                      after_key=after_key)
+                return hash_leaf(records, algorithm) == (leaf.leaf_hash, leaf.row_count)
+
+            with ThreadPoolExecutor(max_workers=self.merkle_workers) as executor:
+                results = list(executor.map(verify_leaf, positions))
+
+            return {
+                'leaves': len(leaves),
+                'root_valid': merkle_root([leaf.leaf_hash for leaf in leaves], algorithm) == q.merkle_root,
+                'verified': len(results),
+                'mismatches': [position for position, valid in zip(positions, results) if not valid]
+            }
+
+        def stream_stored_query(self, id, batch_size=None):
+            # resolves the query once and returns its records as iterator over a single cursor, which fetches
+            # batch_size records per round trip
+            q, metadata = self.__resolve_stored_query(id)
+
+            return {
+                'query': q.as_dict(),
+                'fields': self.__stored_query_fields(q),
+                'meta': metadata,
+                'records': self.__stored_query_records(q, batch_size=batch_size or self.stream_batch_size)
+            }
+
+        def __fulltext_statement(self, resource_fields, query, fulltext_mode=None):
+            fulltext_mode = fulltext_mode or self.fulltext_mode
+            if fulltext_mode == 'text' and not (resource_fields['meta'] or {}).get('fulltext_fields'):
+                # resources without text fields, or created before text indexes were maintained, have no text index
+                fulltext_mode = 'prefix'
+
+            try:
+                return transform_query_to_statement(query, resource_fields['schema'], fulltext_mode)
+            except ValueError as e:
+                raise MongoDbControllerException(str(e))
+
         def query_by_fulltext(self, resource_id, query, projection, sort, offset, limit, include_total,
-                              none_versioned=False):
-            schema = self.resource_fields(resource_id)['schema']
+                              none_versioned=False, cursor=None, total_estimation_threshold=None,
+                              fulltext_mode=None):
+            resource_fields = self.resource_fields(resource_id)
+            schema = resource_fields['schema']
+
+            transformed_statement = self.__fulltext_statement(resource_fields, query, fulltext_mode)
 
-            transformed_statement = transform_query_to_statement(query, schema)
             if not none_versioned:
                 transformed_statement['_latest'] = True
 
             transformed_projection = transform_projection(projection, schema)
 
-            transformed_sort = transform_sort(sort)
+            text_score = '$text' in transformed_statement
+            if text_score:
+                transformed_projection[TEXT_SCORE_FIELD] = {'$meta': 'textScore'}
 
-            result = self._execute_query(resource_id,
-                                         transformed_statement,
-                                         transformed_projection,
-                                         transformed_sort,
-                                         offset, limit, include_total)
+            transformed_sort = transform_sort(sort, text_score)
 
-            result['records'] = list(result['records'])
-
-            return result
+            return self._execute_query(resource_id,
+                                       transformed_statement,
+                                       transformed_projection,
+                                       transformed_sort,
+                                       offset, limit, include_total, cursor, total_estimation_threshold)
 
         def query_by_filters(self, resource_id, filters, projection, sort, offset, limit, include_total, distinct,
-                             none_versioned=False):
+                             none_versioned=False, cursor=None, total_estimation_threshold=None,
+                             distinct_counts=False):
             schema = self.resource_fields(resource_id)['schema']
 
             transformed_statement = transform_filter_to_statement(filters, schema)
@@ -367,28 +920,60 @@ class VersionedDataStoreController:
             transformed_sort = transform_sort(sort)
 
             if distinct:
-                result = self._execute_distinct_query(resource_id, list(transformed_projection)[0], offset, limit)
+                distinct_field = next((field for field, included in transformed_projection.items() if included), None)
+                if distinct_field is None:
+                    raise MongoDbControllerException('For a distinct query, a field of the resource has to be set')
+                result = self._execute_distinct_query(resource_id, distinct_field, transformed_statement, offset, limit,
+                                                      distinct_counts)
             else:
                 result = self._execute_query(resource_id,
                                              transformed_statement,
                                              transformed_projection,
                                              transformed_sort,
-                                             offset, limit, include_total)
-                result['records'] = list(result['records'])
+                                             offset, limit, include_total, cursor, total_estimation_threshold)
 
             return result
 
         def resource_fields(self, resource_id):
-            meta = self._get_resource_metadata(resource_id)
-            fields = self._get_resource_fields(resource_id)
+            # schema and metadata are cached per process. Within the TTL a cached entry is used as it is, afterwards
+            # the metadata is read again and the schema is only reloaded if its version changed in the meantime.
+            entry = self.schema_cache.get(resource_id)
+            now = time.monotonic()
+
+            if entry and now - entry['loaded'] < self.schema_cache_ttl:
+                return copy.deepcopy({'meta': entry['meta'], 'schema': entry['schema']})
+
+            if entry:
+                meta_entry = self._get_catalog_entry(resource_id, {'_id': 0, 'schema': 0})
+                if not meta_entry or meta_entry.get('metadata_version') != entry['version']:
+                    entry = None
+
+            if entry:
+                schema = entry['schema']
+            else:
+                meta_entry = self._get_catalog_entry(resource_id, {'_id': 0})
+                schema = meta_entry.pop('schema', []) if meta_entry else []
+
+            version = meta_entry.get('metadata_version') if meta_entry else None
 
-            meta_entry = meta.find_one({}, {"_id": 0})
-            schema = fields.find({}, {'_id': 0})
+            if meta_entry:
+                self.schema_cache.put(resource_id, {'meta': meta_entry, 'schema': schema, 'version': version,
+                                                    'loaded': now})
 
-            return {'meta': meta_entry, 'schema': list(schema)}
+            return copy.deepcopy({'meta': meta_entry, 'schema': schema})
+
+        def cache_stats(self):
+            return {'schema': self.schema_cache.stats(), 'results': self.result_cache.stats()}
 
     @classmethod
     def get_instance(cls):
+        instance = VersionedDataStoreController.instance
+        if instance is not None and instance.pid != os.getpid():
+            # MongoClient and the connection pool of the querystore are not fork-safe. The clients inherited from the
+            # parent process are left untouched, closing them would close the connections of the parent as well.
+            log.debug('process %s was forked, creating new clients', os.getpid())
+            VersionedDataStoreController.instance = None
+
         if VersionedDataStoreController.instance is None:
 
             mongodb_url = config.get(u'ckanext.mongodatastore.mongodb_url')
@@ -399,9 +984,34 @@ class VersionedDataStoreController:
             ckan_site_url = config.get(u'ckan.site_url')
 
             queue_name = config.get(u'ckan.mongodatastore.queue_name', 'hash_queue')
+            upsert_chunk_size = int(config.get(u'ckanext.mongodatastore.upsert_chunk_size', 1000))
+            hash_algorithm = config.get(u'ckanext.mongodatastore.hash_algorithm', DEFAULT_HASH_ALGORITHM)
+
+            get_hash_algorithm(hash_algorithm)
+
+            ingest_workers = int(config.get(u'ckanext.mongodatastore.ingest_workers', 0))
+            ingest_max_in_flight = int(config.get(u'ckanext.mongodatastore.ingest_max_in_flight', 0)) or None
+            ingest_queue_name = config.get(u'ckanext.mongodatastore.ingest_queue_name', 'ingest_queue')
+            async_upsert_threshold = int(config.get(u'ckanext.mongodatastore.async_upsert_threshold', 0))
+            fulltext_mode = config.get(u'ckanext.mongodatastore.fulltext_mode', 'text')
+            fulltext_language = config.get(u'ckanext.mongodatastore.fulltext_language', 'english')
+            schema_cache_size = int(config.get(u'ckanext.mongodatastore.schema_cache_size', 1000))
+            schema_cache_ttl = float(config.get(u'ckanext.mongodatastore.schema_cache_ttl', 10))
+            result_cache_size = int(config.get(u'ckanext.mongodatastore.result_cache_size', 0))
+            result_cache_dir = config.get(u'ckanext.mongodatastore.result_cache_dir', None)
+            result_cache_disk_size = int(config.get(u'ckanext.mongodatastore.result_cache_disk_size', 10000))
+            stream_batch_size = int(config.get(u'ckanext.mongodatastore.stream_batch_size', 5000))
+            artifact_dir = config.get(u'ckanext.mongodatastore.artifact_dir', None)
+            artifact_compression = config.get(u'ckanext.mongodatastore.artifact_compression', 'true').lower() == 'true'
+            merkle_leaf_size = int(config.get(u'ckanext.mongodatastore.merkle_leaf_size', 0))
+            merkle_workers = int(config.get(u'ckanext.mongodatastore.merkle_workers', 4))
+            querystore_pool_size = int(config.get(u'ckanext.mongodatastore.querystore_pool_size', 5))
+            querystore_max_overflow = int(config.get(u'ckanext.mongodatastore.querystore_max_overflow', 10))
+            querystore_pool_recycle = int(config.get(u'ckanext.mongodatastore.querystore_pool_recycle', 3600))
 
             client = MongoClient(mongodb_url)
-            querystore = QueryStoreController(querystore_url)
+            querystore = QueryStoreController(querystore_url, querystore_pool_size, querystore_max_overflow,
+                                              querystore_pool_recycle)
 
             if sharding_enabled:
                 client.admin.command('enableSharding', database_name)
@@ -412,15 +1022,33 @@ class VersionedDataStoreController:
                                                                                        querystore,
                                                                                        rows_max,
                                                                                        queue_name,
-                                                                                       ckan_site_url)
+                                                                                       ckan_site_url,
+                                                                                       upsert_chunk_size,
+                                                                                       hash_algorithm,
+                                                                                       ingest_workers,
+                                                                                       ingest_max_in_flight,
+                                                                                       ingest_queue_name,
+                                                                                       async_upsert_threshold,
+                                                                                       fulltext_mode,
+                                                                                       fulltext_language,
+                                                                                       schema_cache_size,
+                                                                                       schema_cache_ttl,
+                                                                                       result_cache_size,
+                                                                                       result_cache_dir,
+                                                                                       result_cache_disk_size,
+                                                                                       stream_batch_size,
+                                                                                       artifact_dir,
+                                                                                       artifact_compression,
+                                                                                       merkle_leaf_size,
+                                                                                       merkle_workers)
 
         return VersionedDataStoreController.instance
 
     @classmethod
     def reload_config(cls, cfg):
         cls.instance.client.close()
-        if cls.instance.querystore.session:
-            cls.instance.querystore.session.close()
+        cls.instance.ingest_pipeline.shutdown()
+        cls.instance.querystore.close()
 
         cls.instance = None
         cls.get_instance()
@@ -5,10 +5,10 @@ from ckan.common import config
 from ckan.logic import get_action
 from easyhandle.client import BasicAuthHandleClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import joinedload, scoped_session, sessionmaker
 
 from ckanext.mongodatastore.exceptions import QueryNotFoundException
-from ckanext.mongodatastore.model import Query, RecordField, MetaDataField
+from ckanext.mongodatastore.model import Query, RecordField, MetaDataField, ResultSetLeaf
 from ckanext.mongodatastore.util import calculate_hash
 
 LANDING_PAGE_URL_TEMPLATE = '{}/storedquery/landingpage?id={}'
@@ -21,15 +21,33 @@ log = logging.getLogger(__name__)
 
 
 class QueryStoreController:
-    def __init__(self, querystore_url):
-        self.engine = create_engine(querystore_url, echo=False)
+    def __init__(self, querystore_url, pool_size=5, max_overflow=10, pool_recycle=3600):
+        # connections are checked before they are handed out, so connections closed by the database server are
+        # replaced instead of failing the request
+        self.engine = create_engine(querystore_url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                    pool_recycle=pool_recycle, pool_pre_ping=True)
 
         with open('/etc/ckan/cred.json') as config_file:
             config = json.loads(config_file.read())
         self.handle_client = BasicAuthHandleClient.load_from_config(config)
 
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self.Session = scoped_session(sessionmaker(bind=self.engine))
+
+    @property
+    def session(self):
+        # every thread works with its own session, which is removed at the end of a request by remove_session
+        return self.Session()
+
+    def remove_session(self):
+        self.Session.remove()
+
+    def close(self):
+        self.Session.remove()
+        self.engine.dispose()
+
+    def _query_with_fields(self):
+        # the metadata and record fields are loaded in the same statement as the query
+        return self.session.query(Query).options(joinedload(Query.metadata_fields), joinedload(Query.record_fields))
 
     def _create_handle_entry(self, internal_id):
         landing_page = LANDING_PAGE_URL_TEMPLATE.format(CKAN_SITE_URL, str(internal_id))
@@ -47,9 +65,9 @@ class QueryStoreController:
     def store_query(self, resource_id, query, timestamp, result_hash,
                     hash_algorithm, fields_metadata):
 
-        query_hash = calculate_hash(query)
+        query_hash = calculate_hash(query, hash_algorithm)
         if fields_metadata:
-            record_field_hash = calculate_hash(fields_metadata)
+            record_field_hash = calculate_hash(fields_metadata, hash_algorithm)
         else:
             record_field_hash = None
 
@@ -111,14 +129,16 @@ class QueryStoreController:
         self.session.flush()
         return q, metadata
 
-    def update_hash(self, internal_id, result_hash):
+    def update_hash(self, internal_id, result_hash, result_set_rows=None, result_set_bytes=None):
         log.info('try to update query %s with hash %s', internal_id, result_hash)
 
         staged_query = self.session.query(Query).filter(Query.id == internal_id).first()
+        staged_query.result_set_rows = result_set_rows
+        staged_query.result_set_bytes = result_set_bytes
         q = self.session.query(Query).filter(Query.query_hash == staged_query.query_hash,
                                              Query.result_set_hash == result_hash,
-                                             Query.result_set_hash is not None,
-                                             Query.handle_pid is not None,
+                                             Query.result_set_hash.isnot(None),
+                                             Query.handle_pid.isnot(None),
                                              Query.record_field_hash == staged_query.record_field_hash).first()
 
         if q:
@@ -147,32 +167,53 @@ class QueryStoreController:
             self.session.flush()
             return staged_query, metadata
 
+    def store_leaves(self, internal_id, leaf_size, root, leaves):
+        q = self.session.query(Query).filter(Query.id == internal_id).first()
+        q.merkle_root = root
+        q.merkle_leaf_size = leaf_size
+
+        self.session.query(ResultSetLeaf).filter(ResultSetLeaf.query_id == internal_id).delete()
+
+        for position, leaf in enumerate(leaves):
+            entry = ResultSetLeaf()
+            entry.query_id = internal_id
+            entry.position = position
+            entry.leaf_hash = leaf['hash']
+            entry.row_count = leaf['rows']
+            entry.last_key = leaf['last_key']
+            self.session.add(entry)
+
+        self.session.commit()
+
+    def retrieve_leaves(self, internal_id):
+        return self.session.query(ResultSetLeaf).filter(ResultSetLeaf.query_id == internal_id) \
+            .order_by(ResultSetLeaf.position).all()
+
     def retrieve_query_by_internal_id(self, internal_id):
-        result = self.session.query(Query).filter(Query.id == internal_id).first()
+        result = self._query_with_fields().filter(Query.id == internal_id).first()
 
         if not result:
             raise QueryNotFoundException()
 
-        meta_data = {}
-        for meta_field in self.session.query(MetaDataField).filter(MetaDataField.query_id == result.id):
-            meta_data[meta_field.key] = meta_field.value
+        meta_data = {meta_field.key: meta_field.value for meta_field in result.metadata_fields}
 
         return result, meta_data
 
     def retrieve_query_by_pid(self, pid):
-        result = self.session.query(Query).filter(Query.handle_pid.like(str(pid))).first()
+        result = self._query_with_fields().filter(Query.handle_pid == str(pid)).first()
 
         if not result:
             raise QueryNotFoundException()
 
-        meta_data = {}
-        for meta_field in self.session.query(MetaDataField).filter(MetaDataField.query_id == result.id):
-            meta_data[meta_field.key] = meta_field.value
+        meta_data = {meta_field.key: meta_field.value for meta_field in result.metadata_fields}
 
         return result, meta_data
 
-    def get_cursor_on_ids(self):
-        return self.session.query(Query.id).all()
+    def get_cursor_on_ids(self, since=None):
+        ids = self.session.query(Query.id)
+        if since is not None:
+            ids = ids.filter(Query.timestamp >= since)
+        return ids.order_by(Query.id).all()
 
     def purge_query_store(self):
         self.session.query(Query).delete()
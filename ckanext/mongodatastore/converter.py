@@ -0,0 +1,109 @@
+import logging
+
+from ckanext.mongodatastore.preprocessor import TYPE_CONVERSION_DICT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger(__name__)
+
+NUMPY_TYPES = {
+    int: 'int64',
+    float: 'float64'
+}
+
+# columns with fewer values are not worth the overhead of a numpy conversion
+NUMPY_MIN_VALUES = 256
+
+
+class ConversionReport:
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.error_count = 0
+        self.errors = []
+
+    def add(self, row, field, value, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'field': field, 'value': value, 'message': message})
+
+    def merge(self, other):
+        self.error_count += other.error_count
+        self.errors.extend(other.errors[:self.max_errors - len(self.errors)])
+
+    def as_dict(self):
+        return {'count': self.error_count, 'errors': list(self.errors)}
+
+    def __len__(self):
+        return self.error_count
+
+
+def _is_blank(value):
+    return type(value) is str and (value == '' or value.isspace())
+
+
+class SchemaConverter:
+    def __init__(self, fields):
+        self.field_types = {}
+
+        for field in fields:
+            if 'info' in field and 'type_override' in field['info']:
+                type_name = field['info']['type_override']
+            else:
+                type_name = field['type']
+
+            if type_name in TYPE_CONVERSION_DICT:
+                self.field_types[field['id']] = TYPE_CONVERSION_DICT[type_name]
+
+    def convert(self, records, report=None, row_offset=0):
+        if report is None:
+            report = ConversionReport()
+
+        for field, target_type in self.field_types.items():
+            rows = []
+            values = []
+
+            for row, record in enumerate(records):
+                value = record.get(field)
+                if target_type is not str and _is_blank(value):
+                    record[field] = None
+                elif value and type(value) is not target_type:
+                    rows.append(row)
+                    values.append(value)
+
+            if not values:
+                continue
+
+            converted = None
+            if numpy is not None and target_type in NUMPY_TYPES and len(values) >= NUMPY_MIN_VALUES:
+                converted = self._convert_vectorized(values, target_type)
+
+            if converted is None:
+                converted = self._convert_values(values, target_type, field, rows, row_offset, report)
+
+            for row, value in zip(rows, converted):
+                records[row][field] = value
+
+        return report
+
+    @staticmethod
+    def _convert_vectorized(values, target_type):
+        try:
+            return numpy.asarray(values, dtype=NUMPY_TYPES[target_type]).tolist()
+        except (ValueError, TypeError, OverflowError):
+            # the column contains at least one value numpy can not handle, it is converted value by value to
+            # preserve Python's conversion semantics and to report the offending values
+            return None
+
+    @staticmethod
+    def _convert_values(values, target_type, field, rows, row_offset, report):
+        converted = []
+        for row, value in zip(rows, values):
+            try:
+                converted.append(target_type(value))
+            except (ValueError, TypeError) as e:
+                report.add(row_offset + row, field, value, str(e))
+                converted.append(value)
+        return converted
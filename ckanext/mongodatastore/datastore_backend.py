@@ -1,7 +1,6 @@
 import logging
 
 from ckan.lib.base import abort
-from ckan.logic import get_action
 from ckanext.datastore.backend import DatastoreBackend
 
 from ckanext.mongodatastore.controller.mongodb import VersionedDataStoreController
@@ -52,7 +51,7 @@ class MongoDataStoreBackend(DatastoreBackend):
              ('triggers', triggers), ('calculate_record_count', calculate_record_count)])
 
         if indexes:
-            indexes = indexes.split(',')
+            indexes = [field.strip() for field in indexes.split(',') if field.strip()]
 
         self.mongo_cntr.update_schema(resource_id, fields, indexes, primary_key)
 
@@ -82,7 +81,12 @@ class MongoDataStoreBackend(DatastoreBackend):
         }
 
         upsert_operation = operations[method]
-        upsert_operation(resource_id, records, dry_run)
+
+        threshold = self.mongo_cntr.async_upsert_threshold
+        if threshold and method in ['insert', 'upsert'] and records and len(records) >= threshold:
+            data_dict['job_id'] = self.mongo_cntr.enqueue_upsert(resource_id, records, method, dry_run)
+        else:
+            upsert_operation(resource_id, records, dry_run)
 
         data_dict['records'] = []
         return data_dict
@@ -114,6 +118,9 @@ class MongoDataStoreBackend(DatastoreBackend):
         include_total = data_dict.get(u'include_total', True)
         total_estimation_threshold = data_dict.get(u'total_estimation_threshold', None)
         records_format = data_dict.get(u'records_format', u'objects')
+        cursor = context.get(u'mongodatastore_cursor') if context else None
+        distinct_counts = context.get(u'mongodatastore_distinct_counts', False) if context else False
+        fulltext_mode = context.get(u'mongodatastore_fulltext_mode') if context else None
 
         if limit < MIN_LIMIT:
             limit = MIN_LIMIT
@@ -121,17 +128,21 @@ class MongoDataStoreBackend(DatastoreBackend):
         if limit > MAX_LIMIT:
             limit = MAX_LIMIT
 
-        log_parameter_not_used_warning([(u'plain', plain), (u'language', language),
-                                        (u'total_estimation_threshold', total_estimation_threshold)])
+        log_parameter_not_used_warning([(u'plain', plain), (u'language', language)])
 
         if records_format in [u'tsv', u'lists']:
             abort(501, u"The current version of MongoDatastore only supports CSV queries!")
 
         if query:
-            result = self.mongo_cntr.query_by_fulltext(resource_id, query, fields, sort, offset, limit, include_total)
+            result = self.mongo_cntr.query_by_fulltext(resource_id, query, fields, sort, offset, limit, include_total,
+                                                       cursor=cursor,
+                                                       total_estimation_threshold=total_estimation_threshold,
+                                                       fulltext_mode=fulltext_mode)
         else:
             result = self.mongo_cntr.query_by_filters(resource_id, filters, fields, sort, offset, limit, include_total,
-                                                      distinct)
+                                                      distinct, cursor=cursor,
+                                                      total_estimation_threshold=total_estimation_threshold,
+                                                      distinct_counts=distinct_counts)
 
         result['offset'] = offset
         result['limit'] = limit
@@ -144,10 +155,7 @@ class MongoDataStoreBackend(DatastoreBackend):
         raise NotImplementedError()
 
     def resource_exists(self, id):
-        exists = self.mongo_cntr.resource_exists(id)
-        res_metadata = get_action('resource_show')(None, {'id': id})
-
-        return exists and res_metadata['datastore_active']
+        return self.mongo_cntr.resource_exists(id)
 
     def resource_fields(self, resource_id):
         return self.mongo_cntr.resource_fields(resource_id)
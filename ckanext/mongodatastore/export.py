@@ -0,0 +1,125 @@
+import logging
+
+from ckanext.mongodatastore.preprocessor import TYPE_CONVERSION_DICT
+from ckanext.mongodatastore.util import chunked
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# number of records per record batch, respectively per row group of a Parquet file
+EXPORT_BATCH_SIZE = 50000
+
+COLUMNAR_FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+
+def _arrow_type(datatype):
+    python_type = TYPE_CONVERSION_DICT.get(datatype, str)
+
+    if python_type is int:
+        return pyarrow.int64()
+    elif python_type is float:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def arrow_schema(fields):
+    return pyarrow.schema([(field['id'], _arrow_type(field['type'])) for field in fields])
+
+
+def _column(values, arrow_type):
+    try:
+        return pyarrow.array(values, type=arrow_type)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        pass
+
+    # the column contains values that do not match the field type, e.g. records written before a type override.
+    # They are converted one by one, values that can not be converted are exported as null.
+    if pyarrow.types.is_integer(arrow_type):
+        python_type = int
+    elif pyarrow.types.is_floating(arrow_type):
+        python_type = float
+    else:
+        python_type = str
+
+    converted = []
+    for value in values:
+        try:
+            converted.append(None if value is None else python_type(value))
+        except (ValueError, TypeError):
+            converted.append(None)
+
+    return pyarrow.array(converted, type=arrow_type)
+
+
+def record_batches(records, schema, batch_size=EXPORT_BATCH_SIZE):
+    for chunk in chunked(records, batch_size):
+        columns = [_column([record.get(field.name) for record in chunk], field.type) for field in schema]
+        yield pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class _ChunkSink:
+    # file-like object the Arrow writers write to. The written bytes are collected until they are taken by the
+    # response generator, so only the current record batch is kept in memory.
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _stream(records, fields, open_writer, write_batch, batch_size):
+    schema = arrow_schema(fields)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+
+    for batch in record_batches(records, schema, batch_size):
+        write_batch(writer, batch)
+        data = sink.take()
+        if data:
+            yield data
+
+    writer.close()
+    yield sink.take()
+
+
+def stream_parquet(records, fields, batch_size=EXPORT_BATCH_SIZE):
+    return _stream(records, fields,
+                   lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema),
+                   lambda writer, batch: writer.write_table(pyarrow.Table.from_batches([batch])),
+                   batch_size)
+
+
+def stream_arrow(records, fields, batch_size=EXPORT_BATCH_SIZE):
+    return _stream(records, fields,
+                   lambda sink, schema: pyarrow.ipc.new_stream(sink, schema),
+                   lambda writer, batch: writer.write_batch(batch),
+                   batch_size)
@@ -0,0 +1,79 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ckanext.mongodatastore.converter import ConversionReport
+from ckanext.mongodatastore.util import calculate_hash
+
+log = logging.getLogger(__name__)
+
+
+def prepare_chunk(converter, records, row_offset, hash_algorithm):
+    report = ConversionReport()
+    converter.convert(records, report, row_offset)
+
+    if hash_algorithm:
+        hashes = [calculate_hash(record, hash_algorithm) for record in records]
+    else:
+        hashes = None
+
+    return records, hashes, report
+
+
+class IngestPipeline:
+    def __init__(self, workers=0, max_in_flight=None):
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # worker processes are spawned instead of forked, as the web server process may run other threads
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def run(self, chunks, converter, hash_algorithm, write, parallel=True):
+        # converts and hashes the chunks and passes them in their original order to write. With worker processes
+        # configured, up to max_in_flight chunks are prepared in the pool while the previous chunks are written.
+        report = ConversionReport()
+
+        if self.workers <= 0 or not parallel:
+            row_offset = 0
+            for chunk in chunks:
+                records, hashes, chunk_report = prepare_chunk(converter, chunk, row_offset, hash_algorithm)
+                report.merge(chunk_report)
+                write(records, hashes)
+                row_offset += len(chunk)
+            return report
+
+        executor = self._get_executor()
+        in_flight = deque()
+        row_offset = 0
+
+        def write_next():
+            records, hashes, chunk_report = in_flight.popleft().result()
+            report.merge(chunk_report)
+            write(records, hashes)
+
+        try:
+            for chunk in chunks:
+                if len(in_flight) >= self.max_in_flight:
+                    write_next()
+
+                in_flight.append(executor.submit(prepare_chunk, converter, chunk, row_offset, hash_algorithm))
+                row_offset += len(chunk)
+
+            while in_flight:
+                write_next()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+        return report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
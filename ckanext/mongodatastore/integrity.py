@@ -0,0 +1,167 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+log = logging.getLogger(__name__)
+
+# controller of a worker process, created once by _init_worker
+_worker_controller = None
+
+# results that are checked again when a check is resumed
+RETRY_STATUS = ['error', 'pending']
+
+
+class IntegrityReport:
+    # collects the results of an integrity check. Every result is appended to the checkpoint file as soon as it is
+    # available, so an interrupted check can be resumed with the queries that have not been checked yet.
+
+    def __init__(self, checkpoint=None):
+        self.results = {}
+        self.start = time.time()
+        self.checked = 0
+        self.rows = 0
+        self.bytes = 0
+
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, encoding='utf-8') as checkpoint_file:
+                for line in checkpoint_file:
+                    if line.strip():
+                        result = json.loads(line)
+                        self.results[result['id']] = result
+
+        # failed checks and queries whose hash job had not finished are checked again
+        self.results = {internal_id: result for internal_id, result in self.results.items()
+                        if result['status'] not in RETRY_STATUS}
+        self.resumed = len(self.results)
+        self.checkpoint_file = open(checkpoint, 'a', encoding='utf-8') if checkpoint else None
+
+    def __contains__(self, internal_id):
+        return internal_id in self.results
+
+    def add(self, result):
+        self.results[result['id']] = result
+        self.checked += 1
+        self.rows += result.get('rows', 0)
+        self.bytes += result.get('bytes', 0)
+
+        if self.checkpoint_file:
+            self.checkpoint_file.write(json.dumps(result) + '\n')
+            self.checkpoint_file.flush()
+
+    def close(self):
+        if self.checkpoint_file:
+            self.checkpoint_file.close()
+
+    def summary(self):
+        elapsed = time.time() - self.start
+        status = {}
+        for result in self.results.values():
+            status[result['status']] = status.get(result['status'], 0) + 1
+
+        return {
+            'queries': len(self.results),
+            'resumed': self.resumed,
+            'checked': self.checked,
+            'status': status,
+            'invalid': [result for result in self.results.values() if result['status'] in ['invalid', 'error']],
+            'seconds': elapsed,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'queries_per_second': self.checked / elapsed if elapsed else 0,
+            'rows_per_second': self.rows / elapsed if elapsed else 0,
+            'bytes_per_second': self.bytes / elapsed if elapsed else 0
+        }
+
+
+def _error(q, message):
+    return {'id': q.id, 'pid': q.handle_pid, 'status': 'error', 'message': message}
+
+
+def check_stored_query(cntr, q):
+    try:
+        return cntr.check_stored_query(q)
+    except Exception as e:
+        log.exception('checking query %s failed', q.id)
+        return _error(q, str(e))
+
+
+def _init_worker(get_controller):
+    global _worker_controller
+    _worker_controller = get_controller()
+
+
+def _check_query_in_worker(internal_id):
+    # the query is loaded again by the worker, as it is bound to the querystore session of the process that loaded it
+    q, _ = _worker_controller.querystore.retrieve_query_by_internal_id(internal_id)
+    return check_stored_query(_worker_controller, q)
+
+
+def check_integrity(cntr, report, workers=4, sample=1.0, since=None, on_result=None, get_controller=None):
+    # re-hashing a result set is CPU-bound, so with get_controller the queries are checked in worker processes, each
+    # calling it once for a controller with its own clients. The workers are forked to inherit the configuration of
+    # the calling process. Without get_controller the queries are checked by threads, which only overlap the I/O.
+    if get_controller:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                       initializer=_init_worker, initargs=(get_controller,))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(q):
+        if get_controller:
+            return executor.submit(_check_query_in_worker, q.id)
+        return executor.submit(check_stored_query, cntr, q)
+
+    def add_result(q, result):
+        # a result set with a fingerprint is verified leaf by leaf, to find the part of the result that changed
+        if result['status'] == 'invalid' and q.merkle_root:
+            try:
+                result['mismatched_leaves'] = cntr.verify_stored_query(q.id)['mismatches']
+            except Exception as e:
+                log.exception('verifying the leaves of query %s failed', q.id)
+                result = dict(result, **_error(q, 'verifying the leaves failed: {0}'.format(e)))
+
+        report.add(result)
+        if on_result:
+            on_result(result)
+
+    def add_future_result(future, q):
+        try:
+            result = future.result()
+        except Exception as e:
+            # e.g. a worker process died
+            log.exception('checking query %s failed', q.id)
+            result = _error(q, str(e))
+        add_result(q, result)
+
+    # the queries are loaded from the querystore by this thread, the workers only read the result sets
+    with executor:
+        pending = {}
+
+        for row in cntr.querystore.get_cursor_on_ids(since):
+            internal_id = int(row[0])
+            if internal_id in report or random.random() >= sample:
+                continue
+
+            try:
+                q, _ = cntr.querystore.retrieve_query_by_internal_id(internal_id)
+            except Exception as e:
+                # e.g. the query was removed from the querystore since the ids were read
+                log.exception('loading query %s failed', internal_id)
+                add_result(None, {'id': internal_id, 'status': 'error', 'message': str(e)})
+                continue
+
+            pending[submit(q)] = q
+
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    add_future_result(future, pending.pop(future))
+
+        for future in as_completed(list(pending)):
+            add_future_result(future, pending.pop(future))
+
+    return report
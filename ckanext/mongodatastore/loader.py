@@ -0,0 +1,49 @@
+import csv
+import json
+import time
+
+FILE_FORMATS = ['csv', 'jsonl']
+
+
+def detect_format(path):
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_csv_records(path, delimiter=','):
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        for record in csv.DictReader(csv_file, delimiter=delimiter):
+            yield record
+
+
+def read_jsonl_records(path):
+    with open(path, encoding='utf-8') as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_records(path, file_format=None, delimiter=','):
+    # the records are read lazily, only the chunk that is written is kept in memory
+    file_format = file_format or detect_format(path)
+
+    if file_format == 'csv':
+        return read_csv_records(path, delimiter)
+    return read_jsonl_records(path)
+
+
+class LoadProgress:
+    def __init__(self, interval):
+        self.interval = interval
+        self.count = 0
+        self.start = time.time()
+
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.count / elapsed if elapsed else 0
+
+    def track(self, records):
+        for record in records:
+            yield record
+            self.count += 1
+            if self.count % self.interval == 0:
+                print('{0} rows read ({1:.0f} rows/sec)'.format(self.count, self.rate()))
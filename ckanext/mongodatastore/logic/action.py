@@ -2,12 +2,17 @@ import json
 import logging
 
 from ckan import logic
+from ckan.lib import jobs
+from ckan.plugins import toolkit
 
 from ckanext.mongodatastore.controller.mongodb import VersionedDataStoreController
 from ckanext.mongodatastore.datastore_backend import MIN_LIMIT, MAX_LIMIT
 
 log = logging.getLogger(__name__)
 
+SEARCH_PARAMETERS = ['cursor', 'distinct_counts', 'fulltext_mode']
+BOOLEAN_SEARCH_PARAMETERS = ['distinct_counts']
+
 
 def issue_query_pid(context, data_dict):
     cntr = VersionedDataStoreController.get_instance()
@@ -18,8 +23,9 @@ def issue_query_pid(context, data_dict):
     q = data_dict.get('q', None)
     projection = data_dict.get('projection', [])
     sort = data_dict.get('sort', [])
+    fulltext_mode = data_dict.get('fulltext_mode', None)
 
-    return cntr.issue_pid(resource_id, statement, projection, sort, q)
+    return cntr.issue_pid(resource_id, statement, projection, sort, q, fulltext_mode)
 
 
 @logic.side_effect_free
@@ -51,6 +57,8 @@ def nv_query(context, data_dict):
     skip = int(data_dict.get('offset', 0))
     limit = int(data_dict.get('limit', 0))
     statement = json.loads(data_dict.get('filters', '{}'))
+    cursor = data_dict.get('cursor', None)
+    fulltext_mode = data_dict.get('fulltext_mode', None)
 
     if limit < MIN_LIMIT:
         limit = MIN_LIMIT
@@ -59,12 +67,68 @@ def nv_query(context, data_dict):
         limit = MAX_LIMIT
 
     if q:
-        result = cntr.query_by_fulltext(resource_id, q, projection, sort, skip, limit, True, none_versioned=True)
+        result = cntr.query_by_fulltext(resource_id, q, projection, sort, skip, limit, True, none_versioned=True,
+                                        cursor=cursor, fulltext_mode=fulltext_mode)
     else:
         result = cntr.query_by_filters(resource_id, statement, projection, sort, skip, limit, True, False,
-                                       none_versioned=True)
+                                       none_versioned=True, cursor=cursor)
 
     result['offset'] = skip
     result['limit'] = limit
 
     return result
+
+
+@toolkit.chained_action
+@logic.side_effect_free
+def datastore_search(original_action, context, data_dict):
+    # the datastore_search schema rejects unknown parameters, therefore the parameters only supported by this backend
+    # are handed to it within the context
+    for param in SEARCH_PARAMETERS:
+        value = data_dict.pop(param, None)
+        if value in [None, '']:
+            continue
+
+        # query string values are strings, "false" has to be parsed
+        if param in BOOLEAN_SEARCH_PARAMETERS:
+            value = toolkit.asbool(value)
+        context['mongodatastore_{0}'.format(param)] = value
+
+    return original_action(context, data_dict)
+
+
+@logic.side_effect_free
+def upsert_status(context, data_dict):
+    job_id = data_dict.get('id')
+
+    try:
+        job = jobs.job_from_id(job_id)
+    except KeyError:
+        raise logic.NotFound('No upsert job with id {0} found'.format(job_id))
+
+    if not job.func_name.endswith('.upsert_job'):
+        raise logic.NotFound('No upsert job with id {0} found'.format(job_id))
+
+    # the status of a job is visible to the users who are allowed to write to its resource
+    toolkit.check_access('datastore_upsert', context, {'resource_id': job.args[0]})
+
+    status = {
+        'id': job.id,
+        'title': job.meta.get('title'),
+        'status': job.get_status(),
+        'progress': job.meta.get('progress')
+    }
+
+    if job.is_failed:
+        # only the exception of the failed job is returned, not the traceback
+        exc_lines = (job.exc_info or '').strip().splitlines()
+        status['error'] = exc_lines[-1] if exc_lines else 'The upsert job failed'
+
+    return status
+
+
+@logic.side_effect_free
+def cache_stats(context, data_dict):
+    cntr = VersionedDataStoreController.get_instance()
+
+    return cntr.cache_stats()
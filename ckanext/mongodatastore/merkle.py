@@ -0,0 +1,59 @@
+from ckanext.mongodatastore.util import DEFAULT_HASH_ALGORITHM, ResultSetHasher, calculate_hash
+
+
+def merkle_root(leaf_hashes, algorithm=DEFAULT_HASH_ALGORITHM):
+    # the hashes of two neighbouring nodes are hashed together, until a single node is left. A node without neighbour
+    # is passed on to the next level unchanged.
+    level = list(leaf_hashes)
+
+    if not level:
+        return calculate_hash('', algorithm)
+
+    while len(level) > 1:
+        next_level = [calculate_hash(level[i] + level[i + 1], algorithm) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+
+    return level[0]
+
+
+class MerkleLeaves:
+    # splits a sorted result set into leaves of leaf_size records. Besides its hash and size, every leaf keeps the sort
+    # key of its last record, so a leaf can be fetched again on its own, starting after the key of the previous leaf.
+
+    def __init__(self, leaf_size, algorithm=DEFAULT_HASH_ALGORITHM):
+        self.leaf_size = leaf_size
+        self.algorithm = algorithm
+        self.leaves = []
+        self._hasher = None
+        self._last_key = None
+
+    def update(self, document, key):
+        if self._hasher is None:
+            self._hasher = ResultSetHasher(self.algorithm)
+
+        self._hasher.update(document)
+        self._last_key = key
+
+        if self._hasher.count == self.leaf_size:
+            self._close_leaf()
+
+    def _close_leaf(self):
+        self.leaves.append({'hash': self._hasher.hexdigest(), 'rows': self._hasher.count, 'last_key': self._last_key})
+        self._hasher = None
+
+    def finish(self):
+        if self._hasher is not None:
+            self._close_leaf()
+        return self.leaves
+
+    def root(self):
+        return merkle_root([leaf['hash'] for leaf in self.leaves], self.algorithm)
+
+
+def hash_leaf(documents, algorithm=DEFAULT_HASH_ALGORITHM):
+    hasher = ResultSetHasher(algorithm)
+    for document in documents:
+        hasher.update(document)
+    return hasher.hexdigest(), hasher.count
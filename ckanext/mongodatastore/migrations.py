@@ -0,0 +1,88 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, inspect
+
+from ckanext.mongodatastore.model import Base, SchemaVersion
+
+log = logging.getLogger(__name__)
+
+
+def add_columns(table_name, column_names):
+    def migration(connection):
+        table = Base.metadata.tables[table_name]
+        existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+        preparer = connection.dialect.identifier_preparer
+
+        for name in column_names:
+            if name not in existing:
+                column = table.columns[name]
+                connection.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+                    preparer.format_table(table), preparer.format_column(column),
+                    column.type.compile(dialect=connection.dialect)))
+
+    return migration
+
+
+def create_tables(*table_names):
+    def migration(connection):
+        for table_name in table_names:
+            Base.metadata.tables[table_name].create(connection, checkfirst=True)
+
+    return migration
+
+
+def create_indexes(*table_names):
+    def migration(connection):
+        inspector = inspect(connection)
+        for table_name in table_names:
+            existing = {index['name'] for index in inspector.get_indexes(table_name)}
+            for index in Base.metadata.tables[table_name].indexes:
+                if index.name not in existing:
+                    index.create(connection)
+
+    return migration
+
+
+# every migration checks whether its changes already exist, so it can be applied to a querystore that has been
+# changed by hand or created from the current model
+MIGRATIONS = [
+    (1, 'result set size', [add_columns('QUERY', ['result_set_rows', 'result_set_bytes'])]),
+    (2, 'result set fingerprints', [add_columns('QUERY', ['merkle_root', 'merkle_leaf_size']),
+                                    create_tables('RESULT_SET_LEAF')]),
+    (3, 'querystore indexes', [create_indexes('QUERY', 'META_DATA_FIELD', 'RECORD_FIELD', 'RESULT_SET_LEAF')])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    if not connection.dialect.has_table(connection, SchemaVersion.__tablename__):
+        return 0
+    return connection.execute(func.max(SchemaVersion.version).select()).scalar() or 0
+
+
+def _record_version(connection, version, description):
+    connection.execute(SchemaVersion.__table__.insert().values(version=version, description=description,
+                                                                 applied=datetime.utcnow()))
+
+
+def migrate(engine):
+    # applies the migrations newer than the version of the querystore, each one in its own transaction
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        with engine.begin() as connection:
+            if version <= schema_version(connection):
+                continue
+
+            log.info('applying querystore migration %s: %s', version, description)
+            for step in steps:
+                step(connection)
+            _record_version(connection, version, description)
+
+        applied.append((version, description))
+
+    return applied
+
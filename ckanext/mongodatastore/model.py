@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BIGINT, TEXT, INT, ForeignKey, UniqueConstraint, TIMESTAMP, JSON
+from sqlalchemy import Column, BIGINT, TEXT, INT, ForeignKey, UniqueConstraint, TIMESTAMP, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -19,19 +19,30 @@ class Query(Base):
             'query_hash': self.query_hash,
             'result_set_hash': self.result_set_hash,
             'hash_algorithm': self.hash_algorithm,
-            'record_field_hash': self.record_field_hash
+            'record_field_hash': self.record_field_hash,
+            'result_set_rows': self.result_set_rows,
+            'result_set_bytes': self.result_set_bytes,
+            'merkle_root': self.merkle_root,
+            'merkle_leaf_size': self.merkle_leaf_size
         }
 
     __tablename__ = 'QUERY'
+    # the hash index supports the lookup of queries with the same query and result set when a PID is assigned
+    __table_args__ = (Index('ix_QUERY_query_hash_result_set_hash', 'query_hash', 'result_set_hash'),)
+
     id = Column(BIGINT, primary_key=True)
-    resource_id = Column(TEXT)
-    handle_pid = Column(TEXT)
-    timestamp = Column(TIMESTAMP)
+    resource_id = Column(TEXT, index=True)
+    handle_pid = Column(TEXT, index=True)
+    timestamp = Column(TIMESTAMP, index=True)
     query = Column(JSON)
     query_hash = Column(TEXT)
     result_set_hash = Column(TEXT)
     hash_algorithm = Column(TEXT)
     record_field_hash = Column(TEXT)
+    result_set_rows = Column(BIGINT)
+    result_set_bytes = Column(BIGINT)
+    merkle_root = Column(TEXT)
+    merkle_leaf_size = Column(INT)
     record_fields = relationship("RecordField", lazy='joined', cascade='all, delete-orphan')
     metadata_fields = relationship("MetaDataField", lazy='joined', cascade='all, delete-orphan')
 
@@ -44,7 +55,7 @@ class MetaDataField(Base):
 
     id = Column(BIGINT, primary_key=True)
     key = Column(TEXT)
-    query_id = Column(BIGINT, ForeignKey('QUERY.id'))
+    query_id = Column(BIGINT, ForeignKey('QUERY.id'), index=True)
     value = Column(TEXT)
 
     UniqueConstraint('key', 'query_id', name='key-query_id-unique-constraint')
@@ -57,8 +68,34 @@ class RecordField(Base):
     __tablename__ = 'RECORD_FIELD'
 
     id = Column(BIGINT, primary_key=True)
-    query_id = Column(BIGINT, ForeignKey('QUERY.id'))
+    query_id = Column(BIGINT, ForeignKey('QUERY.id'), index=True)
     name = Column(TEXT)
     datatype = Column(TEXT)
     description = Column(TEXT)
     order = Column(INT)
+
+
+class ResultSetLeaf(Base):
+    def __init__(self):
+        pass
+
+    __tablename__ = 'RESULT_SET_LEAF'
+    __table_args__ = (Index('ix_RESULT_SET_LEAF_query_id_position', 'query_id', 'position'),)
+
+    id = Column(BIGINT, primary_key=True)
+    query_id = Column(BIGINT, ForeignKey('QUERY.id'))
+    position = Column(INT)
+    leaf_hash = Column(TEXT)
+    row_count = Column(BIGINT)
+    last_key = Column(TEXT)
+
+
+class SchemaVersion(Base):
+    def __init__(self):
+        pass
+
+    __tablename__ = 'SCHEMA_VERSION'
+
+    version = Column(INT, primary_key=True)
+    description = Column(TEXT)
+    applied = Column(TIMESTAMP)
@@ -2,9 +2,11 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 from ckanext.datastore.interfaces import IDatastoreBackend
 from ckanext.mongodatastore import blueprint
-from ckanext.mongodatastore.cli import mongodatastore_init_querystore, mongodatastore_check_integrity
+from ckanext.mongodatastore.cli import mongodatastore_init_querystore, mongodatastore_check_integrity, \
+    mongodatastore_load, mongodatastore_migrate_catalog, mongodatastore_migrate_schema
 from ckanext.mongodatastore.datastore_backend import MongoDataStoreBackend
-from ckanext.mongodatastore.logic.action import issue_query_pid, querystore_resolve, nv_query
+from ckanext.mongodatastore.logic.action import issue_query_pid, querystore_resolve, nv_query, upsert_status, \
+    datastore_search, cache_stats
 from ckanext.mongodatastore.util import encode_handle
 
 
@@ -33,7 +35,10 @@ class MongodatastorePlugin(plugins.SingletonPlugin):
         actions = {
             'issue_pid': issue_query_pid,
             'querystore_resolve': querystore_resolve,
-            'nv_query': nv_query
+            'nv_query': nv_query,
+            'upsert_status': upsert_status,
+            'datastore_search': datastore_search,
+            'cache_stats': cache_stats
         }
 
         return actions
@@ -48,4 +53,5 @@ class MongodatastorePlugin(plugins.SingletonPlugin):
 
     # IClick
     def get_commands(self):
-        return [mongodatastore_init_querystore, mongodatastore_check_integrity]
+        return [mongodatastore_init_querystore, mongodatastore_check_integrity, mongodatastore_load,
+                mongodatastore_migrate_catalog, mongodatastore_migrate_schema]
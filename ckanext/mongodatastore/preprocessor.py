@@ -1,4 +1,10 @@
+import base64
+import re
+
+from datetime import datetime
+
 import pymongo
+from bson import Binary, Decimal128, Int64, ObjectId, Regex, Timestamp, json_util
 
 from ckanext.mongodatastore.util import normalize_json
 
@@ -29,17 +35,71 @@ LOGICAL_OPERATORS = [
     '$or'
 ]
 
+# the BSON types in the order MongoDB sorts them, with the $type aliases and the python types of each bracket. Null
+# and missing values sort before all of them.
+TYPE_BRACKETS = [
+    (['number'], (int, float, Decimal128, Int64)),
+    (['string', 'symbol'], (str,)),
+    (['object'], (dict,)),
+    (['array'], (list,)),
+    (['binData'], (bytes, Binary)),
+    (['objectId'], (ObjectId,)),
+    (['bool'], (bool,)),
+    (['date'], (datetime,)),
+    (['timestamp'], (Timestamp,)),
+    (['regex'], (Regex, type(re.compile(''))))
+]
+
+FULLTEXT_MODES = [
+    'text',
+    'prefix',
+    'regex'
+]
+
+TEXT_SCORE_FIELD = '_score'
+
+RANGE_OPERATORS = [
+    '$gt',
+    '$gte',
+    '$lt',
+    '$lte'
+]
+
+# weights used by select_index_hint for conditions on index key fields
+RANGE = 1
+EQUALITY = 2
+
+# the validity window of a stored query usually matches most versions, conditions on these fields are weighted less
+VERSION_FIELDS = [
+    '_created',
+    '_valid_to'
+]
+
+
+def transform_query_to_statement(query, schema, mode='regex'):
+    # mode 'text' uses the text index of the resource, 'prefix' matches the beginning of values, which can be
+    # answered by indexes on the fields, and 'regex' passes the query unescaped as regular expression
+    if mode not in FULLTEXT_MODES:
+        raise ValueError('Full text mode "{0}" is not supported, use one of: {1}'.format(mode,
+                                                                                       ', '.join(FULLTEXT_MODES)))
+
+    if mode == 'text' and type(query) != dict:
+        return {'$text': {'$search': query}}
+
+    def condition(value):
+        if mode == 'regex':
+            return {'$regex': value}
+        return {'$regex': '^{0}'.format(re.escape(str(value)))}
 
-def transform_query_to_statement(query, schema):
     new_filter = {'$or': []}
     if type(query) == dict:
         for key in query.keys():
-            new_filter['$or'].append({key: {'$regex': query[key]}})
+            new_filter['$or'].append({key: condition(query[key])})
         return new_filter
 
     for field in schema:
         if field['type'] == 'text':
-            new_filter['$or'].append({field['id']: {'$regex': query}})
+            new_filter['$or'].append({field['id']: condition(query)})
     return normalize_json(new_filter)
 
 
@@ -113,7 +173,7 @@ def transform_projection(fields, schema):
     return normalize_json(new_projection)
 
 
-def transform_sort(sort):
+def transform_sort(sort, text_score=False):
     if sort is None:
         sort = []
 
@@ -135,5 +195,144 @@ def transform_sort(sort):
             else:
                 transformed_sort.append((sort_arg, pymongo.ASCENDING))
 
+    if text_score and not transformed_sort:
+        transformed_sort.append((TEXT_SCORE_FIELD, {'$meta': 'textScore'}))
+
     transformed_sort.append(('_id', pymongo.ASCENDING))
     return transformed_sort
+
+
+def add_key_fields(projection, fields):
+    # extends the projection by the given fields, e.g. the sort keys needed to continue after a record. Returns the
+    # extended projection and the fields that have to be removed from the records again.
+    fetch_projection = dict(projection or {})
+
+    if any(fetch_projection.values()):
+        hidden_fields = [field for field in fields if not fetch_projection.get(field)]
+        fetch_projection.update({field: 1 for field in hidden_fields})
+    else:
+        hidden_fields = [field for field in fields if fetch_projection.get(field, 1) == 0]
+        for field in hidden_fields:
+            fetch_projection.pop(field)
+
+    return fetch_projection, hidden_fields
+
+
+def _type_bracket(value):
+    for i, (_, python_types) in enumerate(TYPE_BRACKETS):
+        # bool is a subclass of int, but sorts after the numbers
+        if isinstance(value, python_types) and (bool in python_types or not isinstance(value, bool)):
+            return i
+    return None
+
+
+def _seek_conditions(field, direction, value):
+    # conditions matching the values sorted after value. Range operators only match values of the same type, the
+    # values of the other types are matched by their type bracket. Null and missing values sort before all others.
+    if value is None:
+        return [{'$ne': None}] if direction == pymongo.ASCENDING else []
+
+    if direction == pymongo.ASCENDING:
+        conditions = [{'$gt': value}]
+    else:
+        conditions = [{'$lt': value}, None]
+
+    # _id is always an ObjectId
+    bracket = _type_bracket(value)
+    if field == '_id' or bracket is None:
+        return conditions
+
+    if direction == pymongo.ASCENDING:
+        other_types = [alias for aliases, _ in TYPE_BRACKETS[bracket + 1:] for alias in aliases]
+    else:
+        other_types = [alias for aliases, _ in TYPE_BRACKETS[:bracket] for alias in aliases]
+
+    if other_types:
+        conditions.append({'$type': other_types})
+
+    return conditions
+
+
+def transform_seek(sort, last_key):
+    # builds a predicate that matches all documents sorted after the document with the given sort key values. The
+    # sort always ends with _id, which makes the key unique.
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        for condition in _seek_conditions(field, direction, last_key[i]):
+            clause = {sort[j][0]: last_key[j] for j in range(i)}
+            clause[field] = condition
+            clauses.append(clause)
+
+    return {'$or': clauses}
+
+
+def encode_cursor(sort, last_key):
+    token = json_util.dumps({'sort': [list(sort_arg) for sort_arg in sort], 'key': last_key})
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, sort):
+    try:
+        cursor = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError('The cursor "{0}" is not valid'.format(token))
+
+    if not isinstance(cursor, dict) or not isinstance(cursor.get('key'), list):
+        raise ValueError('The cursor "{0}" is not valid'.format(token))
+
+    if cursor.get('sort') != [list(sort_arg) for sort_arg in sort] or len(cursor.get('key', [])) != len(sort):
+        raise ValueError('The cursor was created for a different sort order')
+
+    return cursor['key']
+
+
+def _field_constraints(statement):
+    constraints = {}
+
+    for key, value in statement.items():
+        if key == '$and':
+            for clause in value:
+                for field, constraint in _field_constraints(clause).items():
+                    constraints[field] = max(constraints.get(field, 0), constraint)
+        elif key.startswith('$'):
+            continue
+        elif type(value) is not dict:
+            constraints[key] = EQUALITY
+        elif '$eq' in value or '$in' in value:
+            constraints[key] = EQUALITY
+        elif any(op in value for op in RANGE_OPERATORS) or str(value.get('$regex', '')).startswith('^'):
+            constraints[key] = RANGE
+
+    return constraints
+
+
+def select_index_hint(statement, indexes):
+    # estimates for every index how selective the part of the statement is, that can be answered by the index. An
+    # equality on a key field narrows the scanned range more than a range condition, after which the remaining key
+    # fields can not be used anymore. Partial and text indexes are not considered, as they do not cover all versions.
+    if '$text' in statement:
+        return None
+
+    constraints = _field_constraints(statement)
+
+    best_index = None
+    best_cost = (0, 0)
+
+    for name, info in indexes.items():
+        if 'partialFilterExpression' in info or any(type(direction) is not int for _, direction in info['key']):
+            continue
+
+        selectivity = 0
+        for field, _ in info['key']:
+            constraint = constraints.get(field)
+            if constraint is None:
+                break
+            selectivity += constraint / 2 if field in VERSION_FIELDS else constraint
+            if constraint == RANGE:
+                break
+
+        cost = (selectivity, -len(info['key']))
+        if selectivity and cost > best_cost:
+            best_index, best_cost = name, cost
+
+    return best_index
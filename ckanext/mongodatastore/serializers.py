@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from ckanext.mongodatastore.util import chunked
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# number of records that are serialized into one chunk of the response
+SERIALIZER_BATCH_SIZE = 1000
+
+# content encodings in the order of preference
+CONTENT_ENCODINGS = ['zstd', 'gzip']
+
+
+def serialize_csv(records, fields, delimiter=';', include_header=True, batch_size=SERIALIZER_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+
+    if include_header:
+        writer.writerow(fields)
+
+    for batch in chunked(records, batch_size):
+        writer.writerows([['' if record.get(field) is None else record.get(field) for field in fields]
+                          for record in batch])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def serialize_json(records, batch_size=SERIALIZER_BATCH_SIZE):
+    encoder = json.JSONEncoder(default=str, ensure_ascii=False)
+    separator = '[\n'
+
+    for batch in chunked(records, batch_size):
+        yield (separator + ',\n'.join(encoder.encode(record) for record in batch)).encode('utf-8')
+        separator = ',\n'
+
+    yield ('[\n]' if separator == '[\n' else '\n]').encode('utf-8')
+
+
+def _xml_element(name, value, parts):
+    # follows the conventions of xmltodict: lists become repeated elements, None becomes an empty element and
+    # booleans are written in lower case
+    if type(value) is list:
+        for item in value:
+            _xml_element(name, item, parts)
+        return
+
+    parts.append('<{0}>'.format(name))
+    if type(value) is dict:
+        for key, item in value.items():
+            _xml_element(key, item, parts)
+    elif type(value) is bool:
+        parts.append('true' if value else 'false')
+    elif value is not None:
+        parts.append(escape(str(value)))
+    parts.append('</{0}>'.format(name))
+
+
+def serialize_xml(records, batch_size=SERIALIZER_BATCH_SIZE):
+    yield b'<records>'
+
+    for batch in chunked(records, batch_size):
+        parts = []
+        for record in batch:
+            _xml_element('record', record, parts)
+            parts.append('\n')
+        yield ''.join(parts).encode('utf-8')
+
+    yield b'</records>'
+
+
+def select_content_encoding(accept_encodings):
+    for encoding in CONTENT_ENCODINGS:
+        if encoding == 'zstd' and zstandard is None:
+            continue
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(chunks, encoding):
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        if type(chunk) is str:
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
@@ -0,0 +1,42 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from ckanext.mongodatastore.artifacts import ArtifactStore
+
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ArtifactStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_materialize(self):
+        name = self.store.name(1, 'abc', 'csv')
+        chunks = list(self.store.materialize(name, ['id;Country\n', b'1;Austria\n']))
+
+        assert chunks == [b'id;Country\n', b'1;Austria\n']
+        with open(self.store.lookup(name), 'rb') as f:
+            assert f.read() == b'id;Country\n1;Austria\n'
+        with gzip.open(self.store.lookup(name, gzipped=True), 'rb') as f:
+            assert f.read() == b'id;Country\n1;Austria\n'
+
+    def test_interrupted_materialization(self):
+        name = self.store.name(1, 'abc', 'csv')
+        chunks = self.store.materialize(name, ['id;Country\n', '1;Austria\n'])
+        next(chunks)
+        chunks.close()
+
+        assert self.store.lookup(name) is None
+        assert os.listdir(self.directory) == []
+
+    def test_name_depends_on_options(self):
+        assert self.store.name(1, 'abc', 'csv') == '1-abc.csv'
+        assert self.store.name(1, 'abc', 'csv', {'delimiter': ';'}) != self.store.name(1, 'abc', 'csv',
+                                                                                         {'delimiter': ','})
+        assert self.store.name(1, 'abc', 'csv') != self.store.name(1, 'def', 'csv')
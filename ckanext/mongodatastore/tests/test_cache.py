@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ckanext.mongodatastore.cache import LRUCache, ResultCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+
+    def test_pop(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+
+        assert cache.pop('a') == 1
+        assert cache.pop('a') is None
+        assert len(cache) == 0
+
+    def test_disabled_cache(self):
+        cache = LRUCache(0)
+        cache.put('a', 1)
+
+        assert cache.get('a') is None
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_results_are_copied(self):
+        cache = ResultCache(10)
+        result = {'records': [{'id': 1}]}
+        cache.put('a', result)
+        result['records'].append({'id': 2})
+
+        cached = cache.get('a')
+        cached['offset'] = 0
+
+        assert cache.get('a') == {'records': [{'id': 1}]}
+
+    def test_key_depends_on_all_parts(self):
+        assert ResultCache.key('r', 1, {'a': 1, 'b': 2}) == ResultCache.key('r', 1, {'b': 2, 'a': 1})
+        assert ResultCache.key('r', 1, {'a': 1}) != ResultCache.key('r', 2, {'a': 1})
+
+    def test_disk_tier_is_shared(self):
+        ResultCache(10, self.directory, 10).put('a', {'records': []})
+        cache = ResultCache(10, self.directory, 10)
+
+        assert cache.get('a') == {'records': []}
+        assert cache.stats()['disk']['hits'] == 1
+
+    def test_disk_tier_is_bounded(self):
+        cache = ResultCache(0, self.directory, 2)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, {'records': []})
+
+        assert len([key for key in ['a', 'b', 'c'] if cache.get(key) is not None]) == 2
+
+    def test_disk_tier_evicts_least_recently_used_entry(self):
+        cache = ResultCache(0, self.directory, 2)
+        cache.put('a', {'records': []})
+        cache.put('b', {'records': []})
+        cache.get('a')
+        cache.put('c', {'records': []})
+
+        assert cache.get('a') is not None
+        assert cache.get('b') is None
+        assert cache.get('c') is not None
+
+    def test_disk_tier_picks_up_entries_of_other_processes(self):
+        cache = ResultCache(0, self.directory, 2)
+        ResultCache(0, self.directory, 2).put('a', {'records': []})
+        cache.put('b', {'records': []})
+        cache.put('c', {'records': []})
+
+        assert sorted(os.listdir(self.directory)) == ['b.pickle', 'c.pickle']
+
+    def test_disabled_cache(self):
+        assert not ResultCache(0).enabled
+        assert not ResultCache(0, self.directory, 0).enabled
@@ -0,0 +1,55 @@
+import unittest
+
+from ckanext.mongodatastore.converter import SchemaConverter, ConversionReport
+
+SCHEMA = [
+    {'id': 'id', 'type': 'int'},
+    {'id': 'Country', 'type': 'text'},
+    {'id': 'GDP', 'type': 'numeric'},
+    {'id': 'Population', 'type': 'text', 'info': {'type_override': 'bigint'}},
+    {'id': 'Created', 'type': 'timestamp'}
+]
+
+
+class TestSchemaConverter(unittest.TestCase):
+
+    def test_convert_types(self):
+        records = [{'id': '1', 'Country': 'Austria', 'GDP': '417.2', 'Population': '8901064'},
+                   {'id': 2, 'Country': 1234, 'GDP': 100, 'Population': 83166711}]
+
+        SchemaConverter(SCHEMA).convert(records)
+
+        assert records[0] == {'id': 1, 'Country': 'Austria', 'GDP': 417.2, 'Population': 8901064}
+        assert records[1] == {'id': 2, 'Country': '1234', 'GDP': 100.0, 'Population': 83166711}
+        assert type(records[1]['GDP']) == float
+
+    def test_blank_numeric_values(self):
+        records = [{'id': '1', 'GDP': ''}, {'id': '2', 'GDP': '  '}, {'id': '3', 'Country': ''}]
+
+        SchemaConverter(SCHEMA).convert(records)
+
+        assert records == [{'id': 1, 'GDP': None}, {'id': 2, 'GDP': None}, {'id': 3, 'Country': ''}]
+
+    def test_unknown_types_are_not_converted(self):
+        records = [{'id': '1', 'Created': '2020-01-01'}]
+
+        SchemaConverter(SCHEMA).convert(records)
+
+        assert records == [{'id': 1, 'Created': '2020-01-01'}]
+
+    def test_conversion_errors_are_reported(self):
+        records = [{'id': '1', 'GDP': 'n/a'}, {'id': 'x'}]
+
+        report = SchemaConverter(SCHEMA).convert(records, ConversionReport(), 10)
+
+        assert len(report) == 2
+        assert records == [{'id': 1, 'GDP': 'n/a'}, {'id': 'x'}]
+        assert [(e['row'], e['field'], e['value']) for e in report.errors] == [(11, 'id', 'x'), (10, 'GDP', 'n/a')]
+
+    def test_report_is_bounded(self):
+        records = [{'id': 'x'} for _ in range(5)]
+
+        report = SchemaConverter(SCHEMA).convert(records, ConversionReport(max_errors=2))
+
+        assert report.as_dict()['count'] == 5
+        assert len(report.as_dict()['errors']) == 2
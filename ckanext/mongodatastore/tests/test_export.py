@@ -0,0 +1,46 @@
+import io
+import unittest
+
+from ckanext.mongodatastore import export
+
+FIELDS = [{'id': 'id', 'type': 'int'}, {'id': 'Country', 'type': 'text'}, {'id': 'GDP', 'type': 'float'}]
+
+
+def generate_records(count):
+    for i in range(count):
+        yield {'_id': i, 'id': i, 'Country': 'Austria', 'GDP': i / 2}
+
+
+@unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+class TestColumnarExport(unittest.TestCase):
+
+    def test_parquet_row_groups(self):
+        import pyarrow.parquet
+
+        data = b''.join(export.stream_parquet(generate_records(10), FIELDS, batch_size=4))
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(data))
+
+        assert parquet_file.num_row_groups == 3
+        assert parquet_file.schema_arrow.names == ['id', 'Country', 'GDP']
+        assert parquet_file.read().column('GDP').to_pylist()[:2] == [0.0, 0.5]
+
+    def test_arrow_stream(self):
+        import pyarrow.ipc
+
+        data = b''.join(export.stream_arrow(generate_records(3), FIELDS))
+        table = pyarrow.ipc.open_stream(data).read_all()
+
+        assert table.to_pylist()[0] == {'id': 0, 'Country': 'Austria', 'GDP': 0.0}
+
+    def test_values_of_other_types(self):
+        records = [{'id': '1', 'Country': 3, 'GDP': 'n/a'}]
+
+        data = b''.join(export.stream_arrow(records, FIELDS))
+        table = export.pyarrow.ipc.open_stream(data).read_all()
+
+        assert table.to_pylist() == [{'id': 1, 'Country': '3', 'GDP': None}]
+
+    def test_empty_result(self):
+        data = b''.join(export.stream_arrow([], FIELDS))
+
+        assert export.pyarrow.ipc.open_stream(data).read_all().num_rows == 0
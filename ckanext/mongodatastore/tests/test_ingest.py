@@ -0,0 +1,37 @@
+import unittest
+
+from ckanext.mongodatastore.converter import SchemaConverter
+from ckanext.mongodatastore.ingest import IngestPipeline
+from ckanext.mongodatastore.util import calculate_hash, chunked
+
+SCHEMA = [{'id': 'id', 'type': 'int'}, {'id': 'Country', 'type': 'text'}]
+
+
+class TestIngestPipeline(unittest.TestCase):
+
+    def run_pipeline(self, pipeline):
+        records = [{'id': str(i), 'Country': 'Austria'} for i in range(10)] + [{'id': 'x'}]
+        written = []
+
+        report = pipeline.run(chunked(records, 3), SchemaConverter(SCHEMA), 'md5',
+                              lambda chunk, hashes: written.append((chunk, hashes)))
+        pipeline.shutdown()
+
+        return report, written
+
+    def test_serial_pipeline(self):
+        report, written = self.run_pipeline(IngestPipeline())
+
+        assert [len(chunk) for chunk, hashes in written] == [3, 3, 3, 2]
+        assert written[0][0][0] == {'id': 0, 'Country': 'Austria'}
+        assert written[0][1][0] == calculate_hash({'id': 0, 'Country': 'Austria'})
+        assert len(report) == 1
+        assert report.errors[0]['row'] == 10
+
+    def test_parallel_pipeline_preserves_order(self):
+        report, written = self.run_pipeline(IngestPipeline(workers=2, max_in_flight=2))
+
+        assert [record['id'] for chunk, hashes in written for record in chunk] == list(range(10)) + ['x']
+        assert [len(hashes) for chunk, hashes in written] == [3, 3, 3, 2]
+        assert len(report) == 1
+        assert report.errors[0]['row'] == 10
@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from ckanext.mongodatastore.integrity import IntegrityReport, check_integrity
+
+
+class FakeQueryStore:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def get_cursor_on_ids(self, since=None):
+        return [(q.id,) for q in self.queries.values() if since is None or q.timestamp >= since]
+
+    def retrieve_query_by_internal_id(self, internal_id):
+        return self.queries[internal_id], {}
+
+
+class FakeController:
+    def __init__(self, statuses, merkle_root=None, leaf_error=None):
+        self.statuses = statuses
+        self.leaf_error = leaf_error
+        self.checked = []
+        self.querystore = FakeQueryStore({
+            internal_id: SimpleNamespace(id=internal_id, handle_pid='pid/{0}'.format(internal_id),
+                                         timestamp=datetime(2020, 1, internal_id), merkle_root=merkle_root)
+            for internal_id in statuses
+        })
+
+    def check_stored_query(self, q):
+        self.checked.append(q.id)
+        status = self.statuses[q.id]
+        if status == 'error':
+            raise ValueError('collection dropped')
+        return {'id': q.id, 'pid': q.handle_pid, 'status': status, 'rows': 10, 'bytes': 100}
+
+    def verify_stored_query(self, internal_id):
+        if self.leaf_error:
+            raise self.leaf_error
+        return {'mismatches': [2]}
+
+
+def get_worker_controller():
+    return FakeController({1: 'valid', 2: 'invalid', 3: 'error'}, merkle_root='root')
+
+
+class TestIntegrityCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'checkpoint.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_report(self):
+        cntr = FakeController({1: 'valid', 2: 'invalid', 3: 'legacy', 4: 'error'})
+
+        summary = check_integrity(cntr, IntegrityReport(), workers=2).summary()
+
+        assert summary['checked'] == 4
+        assert summary['status'] == {'valid': 1, 'invalid': 1, 'legacy': 1, 'error': 1}
+        assert sorted(result['id'] for result in summary['invalid']) == [2, 4]
+        assert summary['rows'] == 30
+        assert summary['bytes'] == 300
+        json.dumps(summary)
+
+    def test_worker_processes(self):
+        cntr = get_worker_controller()
+
+        summary = check_integrity(cntr, IntegrityReport(), workers=2, get_controller=get_worker_controller).summary()
+
+        # the queries are checked by the controllers of the workers, only the leaves are verified by this process
+        assert cntr.checked == []
+        assert summary['status'] == {'valid': 1, 'invalid': 1, 'error': 1}
+        assert [result['mismatched_leaves'] for result in summary['invalid'] if result['id'] == 2] == [[2]]
+
+    def test_resume_from_checkpoint(self):
+        cntr = FakeController({1: 'valid', 2: 'pending', 3: 'error', 4: 'invalid'})
+        report = check_integrity(cntr, IntegrityReport(self.checkpoint))
+        report.close()
+
+        cntr = FakeController({1: 'valid', 2: 'valid', 3: 'valid', 4: 'invalid'})
+        report = check_integrity(cntr, IntegrityReport(self.checkpoint))
+        report.close()
+        summary = report.summary()
+
+        assert sorted(cntr.checked) == [2, 3]
+        assert summary['resumed'] == 2
+        assert summary['status'] == {'valid': 3, 'invalid': 1}
+
+    def test_sample(self):
+        cntr = FakeController({1: 'valid', 2: 'valid'})
+
+        check_integrity(cntr, IntegrityReport(), sample=0)
+
+        assert cntr.checked == []
+
+    def test_since(self):
+        cntr = FakeController({1: 'valid', 2: 'valid', 3: 'valid'})
+
+        check_integrity(cntr, IntegrityReport(), since=datetime(2020, 1, 2))
+
+        assert sorted(cntr.checked) == [2, 3]
+
+    def test_mismatched_leaves(self):
+        cntr = FakeController({1: 'invalid'}, merkle_root='abc')
+
+        summary = check_integrity(cntr, IntegrityReport()).summary()
+
+        assert summary['invalid'][0]['mismatched_leaves'] == [2]
+
+    def test_failed_leaf_verification(self):
+        cntr = FakeController({1: 'invalid', 2: 'valid'}, merkle_root='abc', leaf_error=ValueError('invalid key'))
+
+        summary = check_integrity(cntr, IntegrityReport()).summary()
+
+        assert summary['status'] == {'error': 1, 'valid': 1}
+        assert 'invalid key' in summary['invalid'][0]['message']
+
+    def test_missing_query(self):
+        cntr = FakeController({1: 'valid', 2: 'valid'})
+        del cntr.querystore.queries[1]
+        cntr.querystore.get_cursor_on_ids = lambda since=None: [(1,), (2,)]
+
+        summary = check_integrity(cntr, IntegrityReport()).summary()
+
+        assert summary['status'] == {'error': 1, 'valid': 1}
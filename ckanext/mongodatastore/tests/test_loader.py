@@ -0,0 +1,82 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from ckanext.mongodatastore.loader import LoadProgress, detect_format, read_csv_records, read_jsonl_records, \
+    read_records
+from ckanext.mongodatastore.util import chunked
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        return path
+
+    def test_detect_format(self):
+        assert detect_format('records.jsonl') == 'jsonl'
+        assert detect_format('RECORDS.NDJSON') == 'jsonl'
+        assert detect_format('records.csv') == 'csv'
+        assert detect_format('records.txt') == 'csv'
+
+    def test_read_csv_records(self):
+        path = self.write('records.csv', 'id,name\r\n1,"Woerister, Florian"\r\n2,Ümit\r\n')
+
+        assert list(read_csv_records(path)) == [{'id': '1', 'name': 'Woerister, Florian'},
+                                                {'id': '2', 'name': 'Ümit'}]
+
+    def test_read_csv_records_with_delimiter(self):
+        path = self.write('records.csv', 'id;name\n1;a,b\n')
+
+        assert list(read_csv_records(path, ';')) == [{'id': '1', 'name': 'a,b'}]
+
+    def test_read_jsonl_records(self):
+        path = self.write('records.jsonl', '{"id": 1, "tags": ["a"]}\n\n{"id": 2, "value": null}\n')
+
+        assert list(read_jsonl_records(path)) == [{'id': 1, 'tags': ['a']}, {'id': 2, 'value': None}]
+
+    def test_read_records_derives_the_format(self):
+        csv_path = self.write('records.csv', 'id\n1\n')
+        jsonl_path = self.write('records.ndjson', '{"id": 1}\n')
+
+        assert list(read_records(csv_path)) == [{'id': '1'}]
+        assert list(read_records(jsonl_path)) == [{'id': 1}]
+        assert list(read_records(jsonl_path, 'jsonl')) == [{'id': 1}]
+
+    def test_records_are_read_lazily(self):
+        path = self.write('records.jsonl', '{"id": 1}\n{"id": 2}\nnot json\n')
+        records = read_records(path)
+
+        assert next(records) == {'id': 1}
+        assert next(records) == {'id': 2}
+        with self.assertRaises(ValueError):
+            next(records)
+
+    def test_records_are_chunked(self):
+        path = self.write('records.csv', 'id\n' + ''.join('{0}\n'.format(i) for i in range(5)))
+        progress = LoadProgress(2)
+
+        with redirect_stdout(io.StringIO()) as output:
+            chunks = chunked(progress.track(read_records(path)), 2)
+            first_chunk = next(chunks)
+
+            assert first_chunk == [{'id': '0'}, {'id': '1'}]
+            assert progress.count < 5
+
+            rest = list(chunks)
+
+        assert rest == [[{'id': '2'}, {'id': '3'}], [{'id': '4'}]]
+        assert progress.count == 5
+        assert output.getvalue().startswith('2 rows read')
+        assert len(output.getvalue().splitlines()) == 2
@@ -0,0 +1,52 @@
+import unittest
+
+from ckanext.mongodatastore.merkle import MerkleLeaves, hash_leaf, merkle_root
+from ckanext.mongodatastore.util import ResultSetHasher, calculate_hash
+
+
+class TestMerkleRoot(unittest.TestCase):
+
+    def test_single_leaf(self):
+        assert merkle_root(['a']) == 'a'
+
+    def test_pairs(self):
+        expected_result = calculate_hash(calculate_hash('ab') + calculate_hash('cd'))
+
+        assert merkle_root(['a', 'b', 'c', 'd']) == expected_result
+
+    def test_odd_leaf_is_promoted(self):
+        expected_result = calculate_hash(calculate_hash('ab') + 'c')
+
+        assert merkle_root(['a', 'b', 'c']) == expected_result
+
+    def test_empty(self):
+        assert merkle_root([]) == calculate_hash('')
+
+
+class TestMerkleLeaves(unittest.TestCase):
+
+    def test_leaves(self):
+        records = [{'id': i, 'value': 'v{0}'.format(i)} for i in range(5)]
+        leaves = MerkleLeaves(2)
+
+        for record in records:
+            leaves.update(record, [record['id']])
+        result = leaves.finish()
+
+        assert [leaf['rows'] for leaf in result] == [2, 2, 1]
+        assert [leaf['last_key'] for leaf in result] == [[1], [3], [4]]
+        assert result[1]['hash'] == hash_leaf(records[2:4])[0]
+        assert leaves.root() == merkle_root([leaf['hash'] for leaf in result])
+
+    def test_leaf_matches_result_set_hash(self):
+        records = [{'id': 1}, {'id': 2}]
+        hasher = ResultSetHasher('md5')
+        for record in records:
+            hasher.update(record)
+
+        assert hash_leaf(records, 'md5') == (hasher.hexdigest(), 2)
+
+    def test_no_records(self):
+        leaves = MerkleLeaves(10)
+
+        assert leaves.finish() == []
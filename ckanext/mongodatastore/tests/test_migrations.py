@@ -0,0 +1,63 @@
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+from ckanext.mongodatastore import migrations
+from ckanext.mongodatastore.model import Base
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def create_legacy_schema(self):
+        # the querystore schema before the first migration
+        self.engine.execute('CREATE TABLE "QUERY" (id BIGINT PRIMARY KEY, resource_id TEXT, handle_pid TEXT, '
+                            'timestamp TIMESTAMP, query JSON, query_hash TEXT, result_set_hash TEXT, '
+                            'hash_algorithm TEXT, record_field_hash TEXT)')
+        self.engine.execute('CREATE TABLE "META_DATA_FIELD" (id BIGINT PRIMARY KEY, key TEXT, query_id BIGINT, '
+                            'value TEXT)')
+        self.engine.execute('CREATE TABLE "RECORD_FIELD" (id BIGINT PRIMARY KEY, query_id BIGINT, name TEXT, '
+                            'datatype TEXT, description TEXT, "order" INT)')
+
+    def test_migrate_legacy_schema(self):
+        self.create_legacy_schema()
+
+        applied = migrations.migrate(self.engine)
+
+        inspector = inspect(self.engine)
+        columns = {column['name'] for column in inspector.get_columns('QUERY')}
+        indexes = {index['name'] for index in inspector.get_indexes('QUERY')}
+
+        assert [version for version, _ in applied] == [1, 2, 3]
+        assert {'result_set_rows', 'result_set_bytes', 'merkle_root', 'merkle_leaf_size'} <= columns
+        assert 'RESULT_SET_LEAF' in inspector.get_table_names()
+        assert {'ix_QUERY_handle_pid', 'ix_QUERY_query_hash_result_set_hash'} <= indexes
+        with self.engine.connect() as connection:
+            assert migrations.schema_version(connection) == migrations.LATEST_VERSION
+
+    def test_migrate_is_repeatable(self):
+        self.create_legacy_schema()
+        migrations.migrate(self.engine)
+
+        assert migrations.migrate(self.engine) == []
+
+    def test_migrate_new_schema(self):
+        Base.metadata.create_all(self.engine)
+
+        applied = migrations.migrate(self.engine)
+
+        assert [version for version, _ in applied] == [1, 2, 3]
+        with self.engine.connect() as connection:
+            assert migrations.schema_version(connection) == migrations.LATEST_VERSION
+
+    def test_create_all_on_existing_schema(self):
+        # mongodatastore_create_schema on an existing querystore adds the new tables, the migrations the new columns
+        self.create_legacy_schema()
+        Base.metadata.create_all(self.engine)
+
+        migrations.migrate(self.engine)
+
+        columns = {column['name'] for column in inspect(self.engine).get_columns('QUERY')}
+        assert {'result_set_rows', 'merkle_root'} <= columns
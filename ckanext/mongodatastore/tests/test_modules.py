@@ -0,0 +1,48 @@
+import builtins
+import glob
+import os
+import symtable
+import tempfile
+import unittest
+
+import ckanext.mongodatastore
+
+PACKAGE_DIR = os.path.dirname(ckanext.mongodatastore.__file__)
+
+
+def undefined_names(path):
+    # modules importing ckan can not be imported by the tests, so their global names are checked without running them
+    with open(path, encoding='utf-8') as f:
+        module = symtable.symtable(f.read(), path, 'exec')
+
+    defined = {symbol.get_name() for symbol in module.get_symbols() if symbol.is_assigned() or symbol.is_imported()}
+    defined.update(dir(builtins), ['__file__'])
+
+    undefined = set()
+    tables = [module]
+    while tables:
+        table = tables.pop()
+        for symbol in table.get_symbols():
+            if (table is module or symbol.is_global()) and symbol.is_referenced() and \
+                    symbol.get_name() not in defined:
+                undefined.add(symbol.get_name())
+        tables.extend(table.get_children())
+
+    return undefined
+
+
+class TestModules(unittest.TestCase):
+
+    def test_no_undefined_names(self):
+        for path in glob.glob(os.path.join(PACKAGE_DIR, '**', '*.py'), recursive=True):
+            with self.subTest(path=path):
+                assert undefined_names(path) == set()
+
+    def test_undefined_names_are_found(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.py', encoding='utf-8', delete=False) as f:
+            f.write('import os\n\n\ndef dump(summary):\n    return os.sep + json.dumps(summary)\n')
+
+        try:
+            assert undefined_names(f.name) == {'json'}
+        finally:
+            os.remove(f.name)
@@ -1,10 +1,14 @@
+import base64
 import json
 import unittest
 
 import pymongo
 
+from bson import ObjectId
+
 from ckanext.mongodatastore.preprocessor import transform_filter_to_statement, transform_query_to_statement, \
-    transform_projection, transform_sort
+    transform_projection, transform_sort, transform_seek, encode_cursor, decode_cursor, select_index_hint, \
+    add_key_fields
 
 
 class TestTransformStatement(unittest.TestCase):
@@ -105,6 +109,32 @@ class TestTransformQuery(unittest.TestCase):
 
         assert json.dumps(transformed_query) == expected_query
 
+    def test_transform_query_text_mode(self):
+        schema = [{'id': 'Field_1', 'type': 'text'}, {'id': 'Field_2', 'type': 'int'}]
+
+        transformed_query = transform_query_to_statement('Austria Italy', schema, 'text')
+        expected_query = {'$text': {'$search': 'Austria Italy'}}
+
+        assert transformed_query == expected_query
+
+    def test_transform_query_prefix_mode(self):
+        schema = [{'id': 'Field_1', 'type': 'text'}, {'id': 'Field_2', 'type': 'int'}, {'id': 'Field_3', 'type': 'text'}]
+
+        transformed_query = transform_query_to_statement('A.s(', schema, 'prefix')
+        expected_query = '{"$or": [{"Field_1": {"$regex": "^A\\\\.s\\\\("}}, {"Field_3": {"$regex": "^A\\\\.s\\\\("}}]}'
+
+        assert json.dumps(transformed_query) == expected_query
+
+    def test_transform_query_on_specific_field_text_mode(self):
+        transformed_query = transform_query_to_statement({'Field_1': 'Aus'}, [], 'text')
+        expected_query = '{"$or": [{"Field_1": {"$regex": "^Aus"}}]}'
+
+        assert json.dumps(transformed_query) == expected_query
+
+    def test_transform_query_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            transform_query_to_statement('Aus', [], 'fuzzy')
+
 
 class TestTransformProjection(unittest.TestCase):
 
@@ -155,3 +185,143 @@ class TestTransformSort(unittest.TestCase):
                          ('Year', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]
 
         assert transformed_sort == expected_sort
+
+    def test_transform_sort_by_text_score(self):
+        transformed_sort = transform_sort(None, text_score=True)
+        expected_sort = [('_score', {'$meta': 'textScore'}), ('_id', pymongo.ASCENDING)]
+
+        assert transformed_sort == expected_sort
+
+    def test_explicit_sort_overrides_text_score(self):
+        transformed_sort = transform_sort('Country', text_score=True)
+        expected_sort = [('Country', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]
+
+        assert transformed_sort == expected_sort
+
+
+class TestSeek(unittest.TestCase):
+
+    def test_transform_seek(self):
+        sort = [('Country', pymongo.ASCENDING), ('GDP', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+        last_id = ObjectId()
+
+        transformed_seek = transform_seek(sort, ['Austria', 417.2, last_id])
+        expected_seek = {'$or': [{'Country': {'$gt': 'Austria'}},
+                                 {'Country': {'$type': ['object', 'array', 'binData', 'objectId', 'bool', 'date',
+                                                        'timestamp', 'regex']}},
+                                 {'Country': 'Austria', 'GDP': {'$lt': 417.2}},
+                                 {'Country': 'Austria', 'GDP': None},
+                                 {'Country': 'Austria', 'GDP': 417.2, '_id': {'$gt': last_id}}]}
+
+        assert transformed_seek == expected_seek
+
+    def test_transform_seek_after_null_ascending(self):
+        sort = [('GDP', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]
+        last_id = ObjectId()
+
+        transformed_seek = transform_seek(sort, [None, last_id])
+        expected_seek = {'$or': [{'GDP': {'$ne': None}},
+                                 {'GDP': None, '_id': {'$gt': last_id}}]}
+
+        assert transformed_seek == expected_seek
+
+    def test_transform_seek_after_null_descending(self):
+        sort = [('GDP', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+        last_id = ObjectId()
+
+        transformed_seek = transform_seek(sort, [None, last_id])
+        expected_seek = {'$or': [{'GDP': None, '_id': {'$gt': last_id}}]}
+
+        assert transformed_seek == expected_seek
+
+    def test_transform_seek_descending_reaches_null(self):
+        sort = [('Country', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+        last_id = ObjectId()
+
+        transformed_seek = transform_seek(sort, ['Austria', last_id])
+        expected_seek = {'$or': [{'Country': {'$lt': 'Austria'}},
+                                 {'Country': None},
+                                 {'Country': {'$type': ['number']}},
+                                 {'Country': 'Austria', '_id': {'$gt': last_id}}]}
+
+        assert transformed_seek == expected_seek
+
+    def test_cursor_round_trip(self):
+        sort = transform_sort('Country,GDP desc')
+        last_key = ['Austria', 417.2, ObjectId()]
+
+        cursor = encode_cursor(sort, last_key)
+
+        assert decode_cursor(cursor, sort) == last_key
+
+    def test_cursor_of_other_sort_order(self):
+        cursor = encode_cursor(transform_sort('Country'), ['Austria', ObjectId()])
+
+        with self.assertRaises(ValueError):
+            decode_cursor(cursor, transform_sort('Country desc'))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor', transform_sort(None))
+
+    def test_cursor_that_is_not_an_object(self):
+        for value in [[1, 2], 'abc', {'sort': [['_id', 1]], 'key': 1}]:
+            token = base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii')
+
+            with self.assertRaises(ValueError):
+                decode_cursor(token, transform_sort(None))
+
+
+class TestAddKeyFields(unittest.TestCase):
+
+    def test_inclusion_projection(self):
+        result = add_key_fields({'Country': 1, '_id': 0}, ['Country', 'GDP', '_id'])
+        expected_result = ({'Country': 1, 'GDP': 1, '_id': 1}, ['GDP', '_id'])
+
+        assert result == expected_result
+
+    def test_exclusion_projection(self):
+        result = add_key_fields({'GDP': 0, 'Population': 0}, ['GDP', '_id'])
+        expected_result = ({'Population': 0}, ['GDP'])
+
+        assert result == expected_result
+
+    def test_no_projection(self):
+        assert add_key_fields(None, ['_id']) == ({}, [])
+
+
+class TestSelectIndexHint(unittest.TestCase):
+    INDEXES = {
+        '_id_': {'key': [('_id', 1)]},
+        '_created_valid_to_index': {'key': [('_created', 1), ('_valid_to', -1), ('_id', 1)]},
+        '_record_id_latest_index': {'key': [('id', 1), ('_latest', -1)]},
+        'Country_latest_index': {'key': [('Country', 1)], 'partialFilterExpression': {'_latest': True}},
+        'Country_history_index': {'key': [('Country', 1), ('_created', 1), ('_valid_to', 1)]},
+        '_fulltext_index': {'key': [('_fts', 'text'), ('_ftsx', 1)]}
+    }
+
+    VALIDITY = {'_valid_to': {'$gt': '2020-01-01'}, '_created': {'$lte': '2020-01-01'}}
+
+    def test_version_index_without_user_filter(self):
+        hint = select_index_hint(dict(self.VALIDITY), self.INDEXES)
+
+        assert hint == '_created_valid_to_index'
+
+    def test_compound_version_index_for_equality(self):
+        hint = select_index_hint(dict(self.VALIDITY, Country='Austria'), self.INDEXES)
+
+        assert hint == 'Country_history_index'
+
+    def test_record_id_index(self):
+        hint = select_index_hint(dict(self.VALIDITY, id={'$in': [1, 2]}), self.INDEXES)
+
+        assert hint == '_record_id_latest_index'
+
+    def test_conditions_within_and(self):
+        statement = {'$and': [self.VALIDITY, {'Country': {'$regex': '^Aus'}}]}
+
+        assert select_index_hint(statement, self.INDEXES) == 'Country_history_index'
+
+    def test_no_usable_index(self):
+        assert select_index_hint({'GDP': {'$gt': 100}}, self.INDEXES) is None
+        assert select_index_hint({'$text': {'$search': 'Austria'}}, self.INDEXES) is None
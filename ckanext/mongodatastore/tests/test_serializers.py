@@ -0,0 +1,62 @@
+import csv
+import gzip
+import io
+import json
+import unittest
+
+import xml.etree.ElementTree as ElementTree
+
+from ckanext.mongodatastore import serializers
+
+RECORDS = [
+    {'id': 0, 'Country': 'Austria; "AT"', 'GDP': None},
+    {'id': 1, 'Country': 'Italy\nIT', 'GDP': 2.5}
+]
+
+
+class TestSerializers(unittest.TestCase):
+
+    def test_csv(self):
+        data = b''.join(serializers.serialize_csv(iter(RECORDS), ['id', 'Country', 'GDP'], batch_size=1))
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8')), delimiter=';'))
+
+        assert rows == [['id', 'Country', 'GDP'], ['0', 'Austria; "AT"', ''], ['1', 'Italy\nIT', '2.5']]
+
+    def test_csv_without_header(self):
+        data = b''.join(serializers.serialize_csv(iter(RECORDS), ['id'], ',', include_header=False))
+
+        assert data == b'0\n1\n'
+
+    def test_json(self):
+        data = b''.join(serializers.serialize_json(iter(RECORDS), batch_size=1))
+
+        assert json.loads(data.decode('utf-8')) == RECORDS
+
+    def test_empty_json(self):
+        assert json.loads(b''.join(serializers.serialize_json(iter([]))).decode('utf-8')) == []
+
+    def test_xml(self):
+        records = RECORDS + [{'id': 2, 'Tags': ['a', 'b'], 'Active': True, 'Name': '<&>'}]
+        data = b''.join(serializers.serialize_xml(iter(records), batch_size=2))
+        root = ElementTree.fromstring(data)
+
+        assert len(root) == 3
+        assert root[0].find('Country').text == 'Austria; "AT"'
+        assert root[0].find('GDP').text is None
+        assert [tag.text for tag in root[2].findall('Tags')] == ['a', 'b']
+        assert root[2].find('Active').text == 'true'
+        assert root[2].find('Name').text == '<&>'
+
+    def test_gzip_compression(self):
+        chunks = serializers.serialize_json(iter(RECORDS))
+        data = b''.join(serializers.compress(chunks, 'gzip'))
+
+        assert json.loads(gzip.decompress(data).decode('utf-8')) == RECORDS
+
+    @unittest.skipIf(serializers.zstandard is None, 'zstandard is not installed')
+    def test_zstd_compression(self):
+        chunks = serializers.serialize_json(iter(RECORDS))
+        data = b''.join(serializers.compress(chunks, 'zstd'))
+
+        decompressed = serializers.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        assert json.loads(decompressed.decode('utf-8')) == RECORDS
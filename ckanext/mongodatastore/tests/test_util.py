@@ -1,7 +1,9 @@
+import hashlib
 import json
 import unittest
 
-from ckanext.mongodatastore.util import normalize_json, calculate_hash, encode_handle
+from ckanext.mongodatastore.util import normalize_json, calculate_hash, encode_handle, chunked, bson, xxhash, \
+    ResultSetHasher
 
 FLAT_DICT = {
     'firstname': 'Florian',
@@ -80,6 +82,62 @@ class TestHashCalculation(unittest.TestCase):
 
         assert hash_value == expected_hash
 
+    @unittest.skipIf(bson is None, 'pymongo is not installed')
+    def test_blake2b_hash_of_string(self):
+        data = "Lorem ipsum dolor sit amet"
+
+        hash_value = calculate_hash(data, 'blake2b')
+        expected_hash = hashlib.blake2b(data.encode('utf-8'), digest_size=32).hexdigest()
+
+        assert hash_value == expected_hash
+
+    @unittest.skipIf(bson is None, 'pymongo is not installed')
+    def test_blake2b_hash_is_independent_of_key_order(self):
+        data = {'b': 1, 'a': {'d': [1, 2], 'c': 'x'}}
+        reordered_data = {'a': {'c': 'x', 'd': [1, 2]}, 'b': 1}
+
+        assert calculate_hash(data, 'blake2b') == calculate_hash(reordered_data, 'blake2b')
+        assert calculate_hash(data, 'blake2b') != calculate_hash({'b': 2, 'a': {'d': [1, 2], 'c': 'x'}}, 'blake2b')
+
+    @unittest.skipIf(bson is None or xxhash is None, 'pymongo or xxhash is not installed')
+    def test_xxhash_hash_of_dict(self):
+        assert calculate_hash(DEEP_DICT, 'xxh3_128') == calculate_hash(dict(reversed(list(DEEP_DICT.items()))),
+                                                                       'xxh3_128')
+
+    def test_unknown_hash_algorithm(self):
+        with self.assertRaises(ValueError):
+            calculate_hash('abc', 'crc32')
+
+
+class TestResultSetHasher(unittest.TestCase):
+
+    def test_hash_equals_hash_of_list(self):
+        documents = [FLAT_DICT, DEEP_DICT, {'id': 3}]
+
+        hasher = ResultSetHasher()
+        for document in documents:
+            hasher.update(document, 10)
+
+        assert hasher.hexdigest() == calculate_hash(documents)
+        assert hasher.count == 3
+        assert hasher.size == 30
+
+    @unittest.skipIf(bson is None, 'pymongo is not installed')
+    def test_blake2b_hash_equals_hash_of_list(self):
+        documents = [FLAT_DICT, DEEP_DICT]
+
+        hasher = ResultSetHasher('blake2b')
+        for document in documents:
+            hasher.update(document)
+
+        assert hasher.hexdigest() == calculate_hash(documents, 'blake2b')
+
+    def test_empty_result_set(self):
+        hasher = ResultSetHasher()
+
+        assert hasher.hexdigest() == hashlib.md5().hexdigest()
+        assert hasher.count == 0
+
 
 class TestUrlEncoding(unittest.TestCase):
 
@@ -90,3 +148,21 @@ class TestUrlEncoding(unittest.TestCase):
         expected_result = "TEST%2Faf7fb826--fcae--11ea--adc1--0242ac120002"
 
         assert result == expected_result
+
+
+class TestChunked(unittest.TestCase):
+
+    def test_chunked_list(self):
+        result = list(chunked([1, 2, 3, 4, 5], 2))
+        expected_result = [[1, 2], [3, 4], [5]]
+
+        assert result == expected_result
+
+    def test_chunked_generator(self):
+        result = list(chunked((i for i in range(4)), 4))
+        expected_result = [[0, 1, 2, 3]]
+
+        assert result == expected_result
+
+    def test_chunked_empty(self):
+        assert list(chunked([], 3)) == []
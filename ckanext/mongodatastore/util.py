@@ -1,8 +1,19 @@
 import hashlib
 import json
 from collections import OrderedDict
+from itertools import islice
 
-HASH_ALGORITHM = hashlib.md5
+try:
+    import bson
+except ImportError:
+    bson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+DEFAULT_HASH_ALGORITHM = 'md5'
 
 
 def normalize_json(json_data, max_depth=3):
@@ -27,19 +38,102 @@ def __normalize_json_rec(obj, target, max_depth, id_on_first_pos=False):
             target[key] = obj[key]
 
 
-def calculate_hash(data):
-    algo = HASH_ALGORITHM()
-
+def _serialize_json(data):
     if type(data) == str:
-        algo.update(data.encode('utf-8'))
+        yield data.encode('utf-8')
     elif type(data) == dict:
-        algo.update(json.dumps(data, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        yield json.dumps(data, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8')
     elif type(data) == list:
         for doc in data:
-            algo.update(json.dumps(doc, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+            yield json.dumps(doc, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+
+def _canonicalize(value):
+    if isinstance(value, dict):
+        return OrderedDict((key, _canonicalize(value[key])) for key in sorted(value.keys()))
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(item) for item in value]
+    return value
+
+
+def _encode_bson(value):
+    if isinstance(value, dict):
+        return bson.encode(_canonicalize(value))
+    # BSON can only encode documents, other values are wrapped into a document with an empty key
+    return bson.encode({'': _canonicalize(value)})
+
+
+def _serialize_bson(data):
+    if type(data) == str:
+        yield data.encode('utf-8')
+    elif type(data) == list:
+        for doc in data:
+            yield _encode_bson(doc)
+    else:
+        yield _encode_bson(data)
+
+
+# maps the name of an algorithm, as stored in Query.hash_algorithm and in the _hash_algorithm field of records, to
+# the hash function and the serialization it is calculated over. MD5 over sorted JSON is kept for existing PIDs.
+HASH_ALGORITHMS = {
+    'md5': (hashlib.md5, _serialize_json),
+    'blake2b': (lambda: hashlib.blake2b(digest_size=32), _serialize_bson)
+}
+
+if xxhash is not None:
+    HASH_ALGORITHMS['xxh3_128'] = (xxhash.xxh3_128, _serialize_bson)
+
+
+def get_hash_algorithm(name):
+    if name not in HASH_ALGORITHMS:
+        raise ValueError('Hash algorithm "{0}" is not available, supported algorithms are: {1}'.format(
+            name, ', '.join(sorted(HASH_ALGORITHMS.keys()))))
+
+    hash_function, serializer = HASH_ALGORITHMS[name]
+    if serializer is _serialize_bson and bson is None:
+        raise ValueError('Hash algorithm "{0}" requires the bson package of pymongo'.format(name))
+
+    return hash_function, serializer
+
+
+def calculate_hash(data, algorithm=DEFAULT_HASH_ALGORITHM):
+    hash_function, serializer = get_hash_algorithm(algorithm)
+    algo = hash_function()
+
+    for chunk in serializer(data):
+        algo.update(chunk)
 
     return algo.hexdigest()
 
 
+class ResultSetHasher:
+    # calculates the hash of a result set document by document. The hash equals calculate_hash over the list of all
+    # documents, without keeping the result set in memory.
+
+    def __init__(self, algorithm=DEFAULT_HASH_ALGORITHM):
+        hash_function, self.serializer = get_hash_algorithm(algorithm)
+        self.hash = hash_function()
+        self.count = 0
+        self.size = 0
+
+    def update(self, document, size=0):
+        for chunk in self.serializer([document]):
+            self.hash.update(chunk)
+        self.count += 1
+        self.size += size
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def encode_handle(s):
     return s.replace('/','%2F').replace('-', '--')